@@ -0,0 +1,81 @@
+"""
+Reports how much the first-bytes buckets (Definitions.make_buckets and
+Definitions.candidates) prune: how many definitions engine.score checks for
+each file, out of all of them, and the files per second of scoring with the
+buckets and with every definition checked.
+
+The definitions are the installed triddefs.trd, the package given with
+--defs, or else a generated package about the size of the real one (made
+with tests/synthetic.py). The files are those of trid --self-test-perf
+(perf.make_files), read into memory first.
+
+    PYTHONPATH=src python benchmarks/bench_buckets.py [--defs triddefs.trd] [--files N]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+from tridirt import perf
+from tridirt import engine
+from tridirt import matcher
+from tridirt import __main__ as launcher
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "tests"))
+import synthetic  # noqa: E402
+
+# how many definitions a generated package has
+GENERATED_DEFINITIONS = 18000
+
+
+def time_scoring(definitions: engine.Definitions, files: list) -> float:
+    """Scores the files. Returns the files per second."""
+    start = time.perf_counter()
+    for data in files:
+        engine.score(data[:definitions.header_size], definitions,
+                     lambda strings, data=data: matcher.find_strings([data], strings))
+    return len(files) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--defs", help="the definitions package (default: the installed one, or a generated one)")
+    parser.add_argument("--files", type=int, default=perf.BENCHMARK_FILES, help="how many files to score")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="tridirt-bench-") as directory:
+        defs_path = args.defs or f"{launcher.get_program_dir()}/{launcher.TRIDDEFS_DICT['file']}"
+        if not os.path.exists(defs_path):
+            defs_path = os.path.join(directory, "triddefs.trd")
+            synthetic.write_package(defs_path, synthetic.random_definitions(GENERATED_DEFINITIONS))
+        definitions = engine.parse_definitions(defs_path)
+        files_dir = os.path.join(directory, "files")
+        os.mkdir(files_dir)
+        files = []
+        for path in perf.make_files(definitions, files_dir, args.files):
+            with open(path, "rb") as f:
+                files.append(f.read())
+
+    start = time.perf_counter()
+    definitions.prepare()
+    made = time.perf_counter() - start
+    buckets = definitions.buckets
+    checked = sum(len(definitions.candidates(data)) for data in files) / len(files)
+    print(f"{len(definitions)} definitions ({defs_path}), {len(files)} files:")
+    print(f"  {len(buckets)} buckets made in {made * 1000:.1f} ms, the biggest of {max(map(len, buckets.values()))}, "
+          f"{len(buckets.get(b'', ()))} definitions without a pattern at 0")
+    print(f"  {checked:.1f} of the {len(definitions)} definitions checked a file on average "
+          f"({checked / len(definitions):.3%}, the rest pruned)")
+
+    bucketed = time_scoring(definitions, files)
+    # one bucket of everything: candidates gives every definition
+    definitions.buckets = {b"": list(range(len(definitions)))}
+    unbucketed = time_scoring(definitions, files)
+    print(f"  {bucketed:10.0f} files/s with the buckets")
+    print(f"  {unbucketed:10.0f} files/s checking every definition (the buckets are {bucketed / unbucketed:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
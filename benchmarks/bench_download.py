@@ -0,0 +1,57 @@
+"""
+Benchmarks downloading with download_program from a local HTTP server that
+breaks every response off after a number of bytes (tests/server.py), and
+prints the MB/s and how many times the download was resumed.
+
+The backoff between attempts (DOWNLOAD_RETRIES) is part of what is
+measured, unless --no-backoff is given.
+
+    PYTHONPATH=src python benchmarks/bench_download.py [--size MiB] [--no-backoff]
+"""
+
+import io
+import os
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+
+from tridirt import __main__ as launcher
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "tests"))
+import server  # noqa: E402
+
+# after how many bytes every response is broken off, None for never
+DROP_AFTER = (None, 8 * 1024 * 1024, 1024 * 1024, 256 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=32, help="the size of the download, in MiB")
+    parser.add_argument("--no-backoff", action="store_true", help="don't wait between attempts")
+    args = parser.parse_args()
+    if args.no_backoff:
+        time.sleep = lambda seconds: None
+
+    body = os.urandom(args.size * 1024 * 1024)
+    print(f"Downloading {args.size} MiB{' (no backoff)' if args.no_backoff else ''}:")
+    print(f"{'broken off after':>17} {'MB/s':>8} {'resumes':>8}")
+    with tempfile.TemporaryDirectory(prefix="tridirt-bench-") as directory:
+        for drop_after in DROP_AFTER:
+            filepath = os.path.join(directory, "trid.zip")
+            with server.Server({"/trid.zip": body}, drop_after) as s:
+                start = time.perf_counter()
+                with contextlib.redirect_stderr(io.StringIO()):
+                    launcher.download_program(s.url("/trid.zip"), filepath)
+                elapsed = time.perf_counter() - start
+                resumes = len(s.requests) - 1
+            with open(filepath, "rb") as f:
+                assert f.read() == body
+            os.remove(filepath)
+            label = "never" if drop_after is None else f"{drop_after // 1024} KiB"
+            print(f"{label:>17} {len(body) / elapsed / 1e6:8.1f} {resumes:8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Benchmarks how trid --jobs scales: identifies the same files with 1, 2, 4
+and 8 worker processes (batch.identify_files, without the result cache) and
+prints the files per second of each.
+
+The definitions are the installed triddefs.trd, the package given with
+--defs, or else a generated package about the size of the real one (made
+with tests/synthetic.py). The files are those of trid --self-test-perf
+(perf.make_files).
+
+    PYTHONPATH=src python benchmarks/bench_jobs.py [--defs triddefs.trd] [--files N] [--backend NAME]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+from tridirt import perf
+from tridirt import batch
+from tridirt import engine
+from tridirt import __main__ as launcher
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "tests"))
+import synthetic  # noqa: E402
+
+JOBS = (1, 2, 4, 8)
+# how many definitions a generated package has
+GENERATED_DEFINITIONS = 18000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--defs", help="the definitions package (default: the installed one, or a generated one)")
+    parser.add_argument("--files", type=int, default=perf.BENCHMARK_FILES * 5, help="how many files to identify")
+    parser.add_argument("--backend", help="the backend to use (default: the fastest installed)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="tridirt-bench-") as directory:
+        defs_path = args.defs or f"{launcher.get_program_dir()}/{launcher.TRIDDEFS_DICT['file']}"
+        if not os.path.exists(defs_path):
+            defs_path = os.path.join(directory, "triddefs.trd")
+            synthetic.write_package(defs_path, synthetic.random_definitions(GENERATED_DEFINITIONS))
+            engine.save_index(engine.parse_definitions(defs_path), defs_path)
+        definitions = engine.load_definitions(defs_path)
+        files_dir = os.path.join(directory, "files")
+        os.mkdir(files_dir)
+        files = perf.make_files(definitions, files_dir, args.files)
+
+        print(f"{len(files)} files, {len(definitions)} definitions ({defs_path}), {os.cpu_count()} CPUs:")
+        first = None
+        for jobs in JOBS:
+            start = time.perf_counter()
+            for _ in batch.identify_files(files, defs_path, jobs, backend=args.backend):
+                pass
+            rate = len(files) / (time.perf_counter() - start)
+            first = first or rate
+            print(f"  --jobs {jobs}  {rate:8.0f} files/s  ({rate / first:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmarks the ways tridirt.matcher finds which of a set of strings are in
+a file: each string on its own with bytes.__contains__ or stringzilla's
+contains, and all at once with the Aho-Corasick automaton (and how long
+making the automaton takes). The thresholds AUTOMATON_MIN_STRINGS and
+STRINGZILLA_AUTOMATON_MIN_STRINGS are where the automaton gets faster.
+
+The data is random text (lower case, which the search folds), and half of
+the strings are in it.
+
+    PYTHONPATH=src python benchmarks/bench_matcher.py [--size MiB]
+"""
+
+import time
+import random
+import argparse
+
+from tridirt import matcher
+
+STRING_COUNTS = (16, 64, 96, 128, 512, 2048, 4096)
+# the best of this many runs is shown
+RUNS = 3
+
+
+def make_data(rng: random.Random, size: int) -> bytes:
+    return bytes(rng.randrange(97, 123) for _ in range(size))
+
+
+def make_strings(rng: random.Random, data: bytes, count: int) -> set:
+    """Makes count upper-case strings, every other one taken from the data."""
+    strings = set()
+    while len(strings) < count:
+        length = rng.randrange(4, 16)
+        if len(strings) % 2:
+            start = rng.randrange(len(data) - length)
+            strings.add(data[start:start + length].upper())
+        else:
+            strings.add(bytes(rng.randrange(65, 91) for _ in range(length)) + b"\x01")
+    return strings
+
+
+def best_time(function) -> float:
+    """Runs the function RUNS times. Returns the shortest time it took, in seconds."""
+    times = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def time_contains(data: bytes, strings: set, use_stringzilla: bool) -> float:
+    """Times searching each string on its own."""
+    matcher.use_stringzilla(use_stringzilla)
+    min_strings = matcher.AUTOMATON_MIN_STRINGS, matcher.STRINGZILLA_AUTOMATON_MIN_STRINGS
+    matcher.AUTOMATON_MIN_STRINGS = matcher.STRINGZILLA_AUTOMATON_MIN_STRINGS = float("inf")
+    try:
+        return best_time(lambda: matcher.find_strings([data], strings))
+    finally:
+        matcher.AUTOMATON_MIN_STRINGS, matcher.STRINGZILLA_AUTOMATON_MIN_STRINGS = min_strings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=float, default=1, help="the size of the data, in MiB")
+    args = parser.parse_args()
+
+    try:
+        import stringzilla  # noqa: F401
+        has_stringzilla = True
+    except ImportError:
+        has_stringzilla = False
+
+    rng = random.Random(0)
+    data = make_data(rng, int(args.size * 1024 * 1024))
+    print(f"{args.size:g} MiB, time to find which strings are in it (thresholds: automaton from "
+          f"{matcher.AUTOMATON_MIN_STRINGS}, {matcher.STRINGZILLA_AUTOMATON_MIN_STRINGS} with stringzilla):")
+    print(f"{'strings':>8} {'in':>10} {'stringzilla':>12} {'automaton':>10} {'(build)':>10}")
+    for count in STRING_COUNTS:
+        strings = make_strings(rng, data, count)
+        expected = {string for string in strings if string in data.upper()}
+        contains = time_contains(data, strings, False)
+        sz = time_contains(data, strings, True) if has_stringzilla else None
+        build = best_time(lambda: matcher.Automaton(strings))
+        automaton = matcher.Automaton(strings)
+        found = set()
+        search = best_time(lambda: automaton.search(data, found))
+        assert found == expected
+        sz_text = f"{sz * 1000:10.1f}ms" if sz is not None else f"{'-':>12}"
+        print(f"{count:8} {contains * 1000:8.1f}ms {sz_text} {search * 1000:8.1f}ms {build * 1000:8.1f}ms")
+    matcher.use_stringzilla(has_stringzilla)
+
+
+if __name__ == "__main__":
+    main()
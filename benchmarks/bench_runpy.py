@@ -0,0 +1,86 @@
+"""
+Benchmarks the latency of a trid call that starts TrID: with trid.py run in
+the launcher's own interpreter (runpy, the default) and in a second one
+(TRIDIRT_SUBPROCESS=1, as before).
+
+Every call is a new launcher process, as when a pipeline runs trid for each
+file. The launcher runs from a temporary HOME where trid.py is a stand-in
+that prints its arguments, or a copy of a real trid.py given with --trid,
+and no update check is due, so nothing goes to the network.
+
+    PYTHONPATH=src python benchmarks/bench_runpy.py [--calls N] [--trid path/to/trid.py]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+
+from tridirt import __main__ as launcher
+
+# a trid.py that does next to nothing, so the launcher is what is measured
+STAND_IN = "import sys\nprint('trid.py', *sys.argv[1:])\n"
+
+
+def make_home(home: str, trid_path=None):
+    """Makes a HOME with TrID and its definitions installed and just checked for updates."""
+    install_dir = os.path.join(home, ".trid")
+    os.makedirs(install_dir)
+    if trid_path:
+        shutil.copy(trid_path, os.path.join(install_dir, "trid.py"))
+        defs_path = os.path.join(os.path.dirname(trid_path), "triddefs.trd")
+        if os.path.exists(defs_path):
+            shutil.copy(defs_path, os.path.join(install_dir, "triddefs.trd"))
+    else:
+        with open(os.path.join(install_dir, "trid.py"), "w") as f:
+            f.write(STAND_IN)
+    if not os.path.exists(os.path.join(install_dir, "triddefs.trd")):
+        open(os.path.join(install_dir, "triddefs.trd"), "wb").close()
+    checked = datetime.now().strftime(launcher.DT_FORMAT)
+    with open(os.path.join(install_dir, "state.json"), "w") as f:
+        json.dump({"tools": {"TrID": {"checked": checked}, "TrIDDefs": {"checked": checked}}}, f)
+
+
+def time_calls(env: dict, argv: list, calls: int) -> list:
+    """Runs trid calls times. Returns how long each took, in seconds."""
+    command = [sys.executable, "-c", "from tridirt.__main__ import trid_main; trid_main()"] + argv
+    times = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        subprocess.run(command, env=env, stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=50, help="how many trid calls to time each way")
+    parser.add_argument("--trid", help="a real trid.py to run (with the triddefs.trd next to it)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="tridirt-bench-") as home:
+        make_home(home, args.trid)
+        # the launcher processes import the same tridirt as this one
+        env = dict(os.environ, HOME=home, PYTHONPATH=os.path.dirname(os.path.dirname(launcher.__file__)))
+        env.pop("TRIDIRT_BACKGROUND_UPDATES", None)
+        # a file for a real trid.py to identify
+        argv = [launcher.__file__]
+
+        print(f"{args.calls} calls each, {'trid.py ' + args.trid if args.trid else 'stand-in trid.py'}:")
+        print(f"{'':12} {'median':>9} {'min':>9} {'max':>9}")
+        for name, extra in (("subprocess", {"TRIDIRT_SUBPROCESS": "1"}), ("runpy", {})):
+            run_env = dict(env, **extra)
+            if not extra:
+                run_env.pop("TRIDIRT_SUBPROCESS", None)
+            times = sorted(time_calls(run_env, argv, args.calls))
+            print(f"{name:12} {times[len(times) // 2] * 1000:7.1f}ms {times[0] * 1000:7.1f}ms "
+                  f"{times[-1] * 1000:7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
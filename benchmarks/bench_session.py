@@ -0,0 +1,140 @@
+"""
+Benchmarks the launcher's pooled requests session (get_session) against a
+new connection per request, as before, on a local HTTPS stand-in for the
+download site that counts the connections it accepts and the time their
+TLS handshakes take.
+
+Each round is what a launcher run does when its checks are due, with the
+launcher's own check_for_update and download_program: a conditional GET of
+trid.zip (answered 304) and a download of triddefs.zip. The launcher's state
+is kept in a temporary directory. Needs the openssl command to make a
+throwaway certificate.
+
+    PYTHONPATH=src python benchmarks/bench_session.py [--rounds N]
+"""
+
+import io
+import os
+import ssl
+import time
+import contextlib
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.server
+
+import requests
+
+from tridirt import __main__ as launcher
+
+# the size of the stand-in triddefs.zip
+DEFS_SIZE = 2 * 1024 * 1024
+ETAG = '"trid-1"'
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/trid.zip" and self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.send_header("ETag", ETAG)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = self.server.defs if self.path == "/triddefs.zip" else b"trid"
+        self.send_response(200)
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class Server(http.server.ThreadingHTTPServer):
+    """An HTTPS server counting its connections and the seconds spent in TLS handshakes."""
+
+    daemon_threads = True
+
+    def __init__(self, context: ssl.SSLContext):
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.context = context
+        self.defs = os.urandom(DEFS_SIZE)
+        self.connections = 0
+        self.handshake_time = 0.0
+
+    def get_request(self):
+        sock, address = super().get_request()
+        start = time.perf_counter()
+        try:
+            sock = self.context.wrap_socket(sock, server_side=True)
+        except (ssl.SSLError, OSError):
+            sock.close()
+            raise
+        self.handshake_time += time.perf_counter() - start
+        self.connections += 1
+        return sock, address
+
+
+def make_certificate(directory: str) -> tuple:
+    """Makes a self-signed certificate for 127.0.0.1. Returns the paths of it and its key."""
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                    "-keyout", key, "-out", cert, "-subj", "/CN=127.0.0.1",
+                    "-addext", "subjectAltName=IP:127.0.0.1"],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return cert, key
+
+
+def run_round(base: str, directory: str):
+    """Does what a launcher run with its checks due does: check TrID, then download new definitions."""
+    trid = dict(launcher.TRID_DICT, url=f"{base}/trid.zip")
+    launcher.STATE.update(trid, etag=ETAG, checked="01-01-2000 00:00:00")
+    assert launcher.check_for_update(trid) is None
+    defs = dict(launcher.TRIDDEFS_DICT, url=f"{base}/triddefs.zip")
+    response = launcher.check_for_update(defs, force=True)
+    with contextlib.redirect_stderr(io.StringIO()):
+        launcher.download_program(defs["url"], os.path.join(directory, "triddefs.zip"), response)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=20, help="how many launcher runs to do each way")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="tridirt-bench-") as directory:
+        launcher.STATE = launcher.State(os.path.join(directory, "state.json"))
+        cert, key = make_certificate(directory)
+        # trust the certificate (over REQUESTS_CA_BUNDLE and the like too)
+        os.environ["REQUESTS_CA_BUNDLE"] = cert
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        server = Server(context)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"https://127.0.0.1:{server.server_address[1]}"
+
+        print(f"{args.rounds} rounds of a 304 check and a {DEFS_SIZE // 1024} KiB download each:")
+        print(f"{'':20} {'connections':>11} {'handshakes':>11} {'total':>9}")
+        session = launcher.get_session()
+
+        def new_session():
+            # what requests.get does: a session for every request
+            return requests.Session()
+
+        for name, get_session in (("connection each", new_session), ("pooled session", lambda: session)):
+            launcher.get_session = get_session
+            server.connections, server.handshake_time = 0, 0.0
+            start = time.perf_counter()
+            for _ in range(args.rounds):
+                run_round(base, directory)
+            elapsed = time.perf_counter() - start
+            print(f"{name:20} {server.connections:11} {server.handshake_time * 1000:9.1f}ms {elapsed * 1000:7.1f}ms")
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
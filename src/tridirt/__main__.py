@@ -5,27 +5,62 @@
 
 import os
 import sys
-import subprocess
-from pathlib import Path
+import runpy
+import threading
 from datetime import datetime, timedelta
-from zipfile import ZipFile
 
-from tqdm import tqdm
-import requests
+# requests, tqdm, zipfile and subprocess are imported where they are used, as
+# most runs never touch the network and importing them slows down every start
 
-HOME_DIR = Path.home()
+HOME_DIR = os.path.expanduser("~")
 INSTALL_DIR = f"{HOME_DIR}/.trid"
 
-# create the install directory
-if not os.path.exists(INSTALL_DIR):
-    os.makedirs(INSTALL_DIR)
+STATE_FILE = f"{INSTALL_DIR}/state.json"
+# every release is installed into its own directory under VERSIONS_DIR,
+# CURRENT_DIR is a symlink to the active one
+VERSIONS_DIR = f"{INSTALL_DIR}/versions"
+CURRENT_DIR = f"{INSTALL_DIR}/current"
+# how many versions to keep, counting the active one
+KEEP_VERSIONS = 2
+# how many seconds a version is kept after it stops being the active one,
+# however many versions there are, for the runs that started on it
+VERSION_GRACE = 86400
+# held by the launcher that is checking for updates and installing them
+LOCK_FILE = f"{INSTALL_DIR}/.lock"
+# where tridd listens for trid command lines
+SOCKET_FILE = f"{INSTALL_DIR}/tridd.sock"
+# the results of files identified without trid.py, by contents
+CACHE_FILE = f"{INSTALL_DIR}/results.sqlite"
 
-DT_NOW = datetime.now()
+# options of the launcher itself, taken out before the command line goes to
+# the program, and the type of their value (bool for flags without one, list
+# for options that can be given more than once)
+LAUNCHER_OPTIONS = {
+    "--jobs": int,
+    "--no-cache": bool,
+    "--incremental": bool,
+    "--recursive": bool,
+    "--include": list,
+    "--exclude": list,
+    "--backend": str,
+    "--self-test-perf": bool,
+}
+# where the background worker leaves new versions to install on the next start
+STAGED_DIR = f"{INSTALL_DIR}/staged"
 DT_FORMAT = "%m-%d-%Y %H:%M:%S"
 
+# how many seconds all the update checks may take together
+CHECK_DEADLINE = 10
+# how many seconds to wait for another launcher's update before starting anyway
+LOCK_WAIT = 2
+# downloads are read in chunks of these sizes and retried this many times
+MIN_BLOCK_SIZE = 64 * 1024
+MAX_BLOCK_SIZE = 1024 * 1024
+DOWNLOAD_RETRIES = 5
+
 
 def get_datetime(filename):
-    """Gets the datetime from a filename."""
+    """Gets the datetime from a filename (the old *_LU files)."""
     dt = datetime(1, 1, 1)  # default to use if it fails
     try:
         if os.path.exists(filename) and os.path.getsize(filename) != 0:
@@ -37,36 +72,210 @@ def get_datetime(filename):
     return dt
 
 
+class State:
+    """
+    Update state of every tool, kept in a single file (STATE_FILE).
+
+    Each tool has an entry with:
+      checked: When it was last checked for updates (in DT_FORMAT).
+      last_modified, etag: What the server sent for the installed download.
+      version: SHA-256 of the installed zip.
+      path: Where it is installed.
+      members: [CRC-32, size] of every file in the installed zip, by name.
+      staged: The state fields and "file" of a downloaded version that is
+        waiting to be installed, if any.
+
+    Nothing is read when the module is imported; the file is read once, the
+    first time a tool asks for its state. It is written atomically (temp file
+    then rename), so concurrent launchers never see a half-written file.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._tools = None
+        # update checks run in threads
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict:
+        """Reads the tools from the state file."""
+        import json
+        try:
+            with open(self.filename, "r", encoding="utf-8") as f:
+                return json.load(f)["tools"]
+        except FileNotFoundError:
+            return {}
+        except (ValueError, KeyError, TypeError):
+            print(f"Could not read state from {self.filename}")
+            return {}
+
+    def reload(self):
+        """Forgets what was read, so the state file is read again."""
+        self._tools = None
+
+    def get(self, tool: dict) -> dict:
+        """Gets the state entry of the tool."""
+        if self._tools is None:
+            self._tools = self._load()
+        return self._tools.setdefault(tool["name"], {})
+
+    def lastchecked(self, tool: dict) -> datetime:
+        """Gets the datetime of when the tool was last checked."""
+        checked = self.get(tool).get("checked")
+        if checked is None:
+            # not in the state file yet, carry over the old *_LU file
+            return get_datetime(tool["file_lastupdated"])
+        try:
+            return datetime.strptime(checked, DT_FORMAT)
+        except ValueError:
+            print(f"Could not get datetime for {tool['name']} from {self.filename}")
+            return datetime(1, 1, 1)
+
+    def update(self, tool: dict, **fields):
+        """
+        Updates the state entry of the tool and saves the state file.
+
+        tool: The dict of the tool.
+        fields: The fields to set. "checked" defaults to now.
+        """
+        import json
+        import tempfile
+
+        fields.setdefault("checked", datetime.now().strftime(DT_FORMAT))
+        with self._lock:
+            entry = self.get(tool)
+            entry.update(fields)
+            # start from what is on disk, another launcher may have saved since
+            tools = self._load()
+            tools[tool["name"]] = entry
+            self._tools = tools
+
+            fd, tmp_filename = tempfile.mkstemp(prefix=".state-", dir=os.path.dirname(self.filename))
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump({"tools": tools}, f, separators=(",", ":"))
+                os.replace(tmp_filename, self.filename)
+            except BaseException:
+                os.unlink(tmp_filename)
+                raise
+
+
+STATE = State(STATE_FILE)
+
+
+class InstallLock:
+    """
+    Advisory lock on LOCK_FILE, shared by every launcher, held while checking
+    for updates, downloading and installing them. Use it in a with
+    statement, which gives whether the lock was taken:
+
+        with InstallLock(LOCK_WAIT) as locked:
+            if locked:
+                ...
+
+    timeout: How many seconds to wait for the lock. None waits for as long
+             as it takes, 0 doesn't wait at all.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self._file = None
+
+    def _try_lock(self) -> bool:
+        """Takes the lock if it is free."""
+        try:
+            if os.name == "nt":
+                import msvcrt
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        return True
+
+    def __enter__(self) -> bool:
+        import time
+
+        self._file = open(LOCK_FILE, "a+b")
+        start = time.monotonic()
+        while not self._try_lock():
+            if self.timeout is not None and time.monotonic() - start >= self.timeout:
+                self._file.close()
+                self._file = None
+                return False
+            time.sleep(0.05)
+        return True
+
+    def __exit__(self, *exc_info):
+        if self._file is None:
+            return
+        if os.name == "nt":
+            import msvcrt
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        # closing the file releases the flock
+        self._file.close()
+        self._file = None
+
+
+def make_install_dir():
+    """Creates the install directory if it doesn't exist."""
+    if not os.path.exists(INSTALL_DIR):
+        os.makedirs(INSTALL_DIR)
+
+
+def get_program_dir() -> str:
+    """
+    Gets the directory of the installed programs: the active version, or
+    INSTALL_DIR itself for installations from before versions were kept (or
+    where symlinks can't be made).
+    """
+    if os.path.isdir(CURRENT_DIR):
+        # resolve it, so a run stays on the same version from start to end
+        return os.path.realpath(CURRENT_DIR)
+    return INSTALL_DIR
+
+
+def is_installed(tool: dict) -> bool:
+    """Checks if the tool is installed."""
+    return os.path.exists(f"{get_program_dir()}/{tool['file']}")
+
+
+def get_command(tool: dict) -> list:
+    """Gets the command to run the program."""
+    return [sys.executable, f"{get_program_dir()}/{tool['file']}"]
+
+
 TRID_DICT = {
     "name": "TrID",
     "url": "https://mark0.net/download/trid.zip",
-    "command": [sys.executable, f"{INSTALL_DIR}/trid.py"],
+    "file": "trid.py",
     "file_lastupdated": f"{INSTALL_DIR}/TRID_LU"
 }
-TRID_DICT["dt_lastupdated"] = get_datetime(TRID_DICT["file_lastupdated"])
 
 TRIDDEFS_DICT = {
     "name": "TrIDDefs",
     "url": "https://mark0.net/download/triddefs.zip",
+    "file": "triddefs.trd",
     "file_lastupdated": f"{INSTALL_DIR}/TRIDDEFS_LU"
 }
-TRIDDEFS_DICT["dt_lastupdated"] = get_datetime(TRIDDEFS_DICT["file_lastupdated"])
 
 TRIDSCAN_DICT = {
     "name": "TrIDScan",
     "url": "https://mark0.net/download/tridscan.zip",
-    "command": [sys.executable, f"{INSTALL_DIR}/tridscan.py"],
+    "file": "tridscan.py",
     "file_lastupdated": f"{INSTALL_DIR}/TRIDSCAN_LU"
 }
-TRIDSCAN_DICT["dt_lastupdated"] = get_datetime(TRIDSCAN_DICT["file_lastupdated"])
 
 TRIDDEFSPACK_DICT = {
     "name": "TrIDDefsPack",
     "url": "https://mark0.net/download/triddefspack.zip",
-    "command": [sys.executable, f"{INSTALL_DIR}/triddefspack.py"],
+    "file": "triddefspack.py",
     "file_lastupdated": f"{INSTALL_DIR}/TRIDDEFSPACK_LU"
 }
-TRIDDEFSPACK_DICT["dt_lastupdated"] = get_datetime(TRIDDEFSPACK_DICT["file_lastupdated"])
+
+TOOLS = {tool["name"]: tool for tool in (TRID_DICT, TRIDDEFS_DICT, TRIDSCAN_DICT, TRIDDEFSPACK_DICT)}
 
 
 # https://stackoverflow.com/a/3041990
@@ -100,161 +309,847 @@ def query(question, default="yes"):
         sys.stdout.write("Please respond with 'yes' or 'no' " "(or 'y' or 'n').\n")
 
 
-def get_program(url: str):
-    """Downloads the program from the url and unextracts it."""
+_SESSION = None
+
+
+def get_session():
+    """
+    Gets the requests session used for every network call.
+
+    It is created the first time it is needed. Its connections are pooled and
+    kept alive, so checking and downloading several files from the same
+    server only pays for one TCP and TLS handshake.
+    """
+    global _SESSION
+    if _SESSION is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        _SESSION = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        _SESSION.mount("https://", adapter)
+        _SESSION.mount("http://", adapter)
+    return _SESSION
+
+
+def download_program(url: str, filepath: str, response=None) -> dict:
+    """
+    Downloads the program from the url.
+    Returns the state fields of the download.
+
+    The download goes into filepath + ".part" first. If the connection
+    breaks, it is resumed where it stopped with a Range request, retrying
+    with exponential backoff. A .part file left by an earlier run is resumed
+    too, as long as the server still has the same version, and used as it is
+    if it is whole already; if the server won't resume it (a 4xx answer to
+    the Range request), it is thrown away and the download starts over. Only
+    attempts in a row that got no further count towards DOWNLOAD_RETRIES,
+    and other 4xx answers (like 404) aren't retried at all.
+
+    url: The URL of the program.
+    filepath: Where to save the download.
+    response: A streaming response for the url, if the GET was already sent.
+    """
+    import hashlib
+    import time
+    import requests
+    from urllib3.exceptions import HTTPError as Urllib3Error
+    from tqdm import tqdm
+
+    part_filepath = f"{filepath}.part"
+    # the ETag or Last-Modified of the version in the .part file
+    validator_filepath = f"{part_filepath}.validator"
+    validator = None
+    offset = 0
+    finished = False
+    if os.path.exists(part_filepath) and os.path.exists(validator_filepath):
+        with open(validator_filepath, "r", encoding="utf-8") as f:
+            validator = f.read()
+        offset = os.path.getsize(part_filepath)
+        if response is not None:
+            if validator in (response.headers.get("etag"), response.headers.get("last-modified")):
+                # resume instead of using the full response, or use the
+                # .part file as it is if it is whole
+                finished = response.headers.get("content-length") == str(offset)
+                response.close()
+                if not finished:
+                    response = None
+            else:
+                offset = 0
+
+    attempt = 0
+    with tqdm(unit="B", unit_scale=True) as progress_bar:
+        while not finished:
+            attempt_offset = offset
+            try:
+                if response is None:
+                    headers = {}
+                    if offset:
+                        headers["Range"] = f"bytes={offset}-"
+                        headers["If-Range"] = validator
+                    response = get_session().get(url, headers=headers, stream=True, timeout=10)
+                    if offset and 400 <= response.status_code < 500:
+                        response.close()
+                        # a 416 with the size of the .part file: it is whole
+                        if (response.status_code == 416
+                                and response.headers.get("content-range") == f"bytes */{offset}"):
+                            break
+                        # the server won't resume it, start over
+                        response = None
+                        os.remove(part_filepath)
+                        os.remove(validator_filepath)
+                        offset, validator = 0, None
+                        continue
+                if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+                    response.close()
+                    # asking again won't help
+                    raise RuntimeError(f"Could not download file: HTTP {response.status_code}")
+                response.raise_for_status()
+
+                # Sizes in bytes.
+                if response.status_code == 206:
+                    total_size = int(response.headers["content-range"].rsplit("/", maxsplit=1)[-1])
+                else:
+                    # the whole file, start over
+                    offset = 0
+                    total_size = int(response.headers.get("content-length", 0))
+                    validator = response.headers.get("etag") or response.headers.get("last-modified")
+                    if validator:
+                        with open(validator_filepath, "w", encoding="utf-8") as f:
+                            f.write(validator)
+                progress_bar.reset(total=total_size or None)
+                progress_bar.update(offset)
+
+                # read bigger chunks while the connection keeps up with them
+                block_size = MIN_BLOCK_SIZE
+                with open(part_filepath, "ab" if offset else "wb") as file:
+                    while True:
+                        start = time.monotonic()
+                        data = response.raw.read(block_size, decode_content=True)
+                        if not data:
+                            break
+                        elapsed = time.monotonic() - start
+                        file.write(data)
+                        offset += len(data)
+                        progress_bar.update(len(data))
+                        if elapsed < 0.05 and block_size < MAX_BLOCK_SIZE:
+                            block_size *= 2
+                        elif elapsed > 0.5 and block_size > MIN_BLOCK_SIZE:
+                            block_size //= 2
+
+                if total_size != 0 and offset != total_size:
+                    raise requests.ConnectionError(f"got {offset} of {total_size} bytes")
+                break
+            except (requests.RequestException, Urllib3Error) as e:
+                if response is not None:
+                    response.close()
+                response = None
+                offset = os.path.getsize(part_filepath) if validator and os.path.exists(part_filepath) else 0
+                if offset > attempt_offset:
+                    # it got further, start counting again
+                    attempt = 0
+                attempt += 1
+                if attempt > DOWNLOAD_RETRIES:
+                    raise RuntimeError("Could not download file") from e
+                time.sleep(0.25 * 2 ** attempt)
+
+    os.replace(part_filepath, filepath)
+    if os.path.exists(validator_filepath):
+        os.remove(validator_filepath)
+
+    if response.status_code == 416:
+        # finished from the .part file, whose validator is its ETag (which
+        # is quoted) or its Last-Modified
+        is_etag = validator.startswith(('"', 'W/"'))
+        etag, last_modified = (validator, None) if is_etag else (None, validator)
+    else:
+        etag, last_modified = response.headers.get("etag"), response.headers.get("last-modified")
+
+    sha256 = hashlib.sha256()
+    with open(filepath, "rb") as file:
+        for data in iter(lambda: file.read(MAX_BLOCK_SIZE), b""):
+            sha256.update(data)
+
+    return {
+        "last_modified": last_modified,
+        "etag": etag,
+        "version": sha256.hexdigest()
+    }
+
+
+def extract_program(filepath: str, dest_dir=INSTALL_DIR, members=None) -> dict:
+    """
+    Unextracts the zip file into a directory.
+    Returns the manifest of the zip file: [CRC-32, size] by member name.
+
+    Members whose CRC-32 and size match the manifest of the installed version
+    are already there and are skipped, and members that are no longer in the
+    zip file are removed. Every other file is extracted next to the directory
+    first and then renamed over the old one, so a running program never sees
+    a half-written file. Files are never written through, which keeps hard
+    links to older versions intact.
+
+    filepath: The zip file.
+    dest_dir: Where to unextract it (default is INSTALL_DIR).
+    members: The manifest of the installed version, if any.
+    """
+    import tempfile
+    from zipfile import ZipFile
+
+    members = members or {}
+    manifest = {}
+    with tempfile.TemporaryDirectory(prefix=".extract-", dir=INSTALL_DIR) as tmp_dir:
+        with ZipFile(filepath, "r") as zf:
+            for info in zf.infolist():
+                # where zipfile puts it, without "..", drives and the like
+                parts = [part for part in info.filename.split("/") if part not in ("", ".", "..")]
+                target = os.path.join(dest_dir, *parts)
+                if info.is_dir():
+                    os.makedirs(target, exist_ok=True)
+                    continue
+                manifest[info.filename] = [info.CRC, info.file_size]
+                if (members.get(info.filename) == manifest[info.filename]
+                        and os.path.isfile(target) and os.path.getsize(target) == info.file_size):
+                    # unchanged
+                    continue
+                extracted = zf.extract(info, tmp_dir)
+                target = os.path.join(dest_dir, os.path.relpath(extracted, tmp_dir))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(extracted, target)
+
+    for name in members.keys() - manifest.keys():
+        parts = [part for part in name.split("/") if part not in ("", ".", "..")]
+        try:
+            os.remove(os.path.join(dest_dir, *parts))
+        except FileNotFoundError:
+            pass
+    return manifest
+
+
+def copy_program_dir(src_dir: str, dest_dir: str):
+    """
+    Carries the installed files over to a new version directory, as hard
+    links where possible.
+    """
+    import shutil
+
+    for root, dirs, files in os.walk(src_dir):
+        if root == INSTALL_DIR:
+            # an installation from before versions were kept, leave out
+            # everything that is not part of the programs
+            dirs[:] = [d for d in dirs if not d.startswith(".")
+                       and os.path.join(root, d) not in (VERSIONS_DIR, CURRENT_DIR, STAGED_DIR)]
+            files = [f for f in files if not f.startswith(".")
+                     and not f.endswith((".zip", ".part", ".validator", "_LU"))
+                     and os.path.join(root, f) not in (STATE_FILE, CACHE_FILE, f"{CACHE_FILE}-wal",
+                                                       f"{CACHE_FILE}-shm", f"{CACHE_FILE}-journal",
+                                                       SOCKET_FILE)]
+        rel_root = os.path.relpath(root, src_dir)
+        for d in dirs:
+            os.makedirs(os.path.join(dest_dir, rel_root, d), exist_ok=True)
+        for f in files:
+            src, dest = os.path.join(root, f), os.path.join(dest_dir, rel_root, f)
+            try:
+                os.link(src, dest)
+            except OSError:
+                shutil.copy2(src, dest)
+
+
+def remove_old_versions():
+    """
+    Removes all but the newest KEEP_VERSIONS versions, never the active one
+    nor one that stopped being active less than VERSION_GRACE seconds ago
+    (a run that started on it may still be reading it).
+    """
+    import shutil
+    import time
+
+    current = os.path.realpath(CURRENT_DIR)
+    versions = []
+    for entry in os.scandir(VERSIONS_DIR):
+        if entry.name.startswith("."):
+            # an unfinished install, unless it was left behind long ago
+            if entry.stat(follow_symlinks=False).st_mtime < time.time() - 86400:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        elif entry.path != current:
+            versions.append(entry)
+    versions.sort(key=lambda entry: entry.name)
+    for version in versions[:max(len(versions) - (KEEP_VERSIONS - 1), 0)]:
+        # the mtime of a version is when it stopped being active (see install_program)
+        if version.stat(follow_symlinks=False).st_mtime < time.time() - VERSION_GRACE:
+            shutil.rmtree(version.path, ignore_errors=True)
+
+
+def install_program(filepath: str, members=None) -> tuple:
+    """
+    Installs the zip file as a new version and makes it the active one.
+    Returns the directory of the installed programs and the manifest of the
+    zip file (see extract_program).
+
+    The new version starts as a copy of the active one (hard links), the zip
+    file is unextracted into it, and CURRENT_DIR is then switched over with
+    a rename. Other launchers see either the old version or the new one,
+    never something in between.
+
+    filepath: The zip file.
+    members: The manifest of the installed version, if any.
+    """
+    import shutil
+
+    name = os.path.basename(filepath).rsplit(".", maxsplit=1)[0]
+    version = f"{datetime.now():%Y%m%d%H%M%S%f}-{name}-{os.getpid()}"
+    version_dir = f"{VERSIONS_DIR}/{version}"
+    # dot-prefixed while it is built, so it isn't mistaken for a version
+    tmp_dir = f"{VERSIONS_DIR}/.{version}"
+    os.makedirs(tmp_dir)
+    try:
+        copy_program_dir(get_program_dir(), tmp_dir)
+        manifest = extract_program(filepath, tmp_dir, members)
+        os.rename(tmp_dir, version_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    tmp_link = f"{CURRENT_DIR}.{os.getpid()}"
+    try:
+        os.symlink(os.path.relpath(version_dir, INSTALL_DIR), tmp_link, target_is_directory=True)
+    except OSError:
+        # no symlinks (e.g. Windows without the privilege), install in place
+        shutil.rmtree(version_dir, ignore_errors=True)
+        return INSTALL_DIR, extract_program(filepath, INSTALL_DIR, members)
+    previous = os.path.realpath(CURRENT_DIR)
+    os.replace(tmp_link, CURRENT_DIR)
+    if os.path.dirname(previous) == os.path.realpath(VERSIONS_DIR) and os.path.isdir(previous):
+        # mark when the old version stopped being active
+        os.utime(previous)
+    remove_old_versions()
+    return CURRENT_DIR, manifest
+
+
+def get_program(url: str, response=None, members=None) -> dict:
+    """
+    Downloads the program from the url and installs it.
+    Returns the state fields of the download.
+
+    url: The URL of the program.
+    response: A streaming response for the url, if the GET was already sent.
+    members: The manifest of the installed version, if any.
+    """
     filename = url.rsplit('/', maxsplit=1)[-1]
     filepath = f"{INSTALL_DIR}/{filename}"
+    fields = download_program(url, filepath, response)
+    # now install the zip file
+    fields["path"], fields["members"] = install_program(filepath, members)
+    return fields
 
-    # https://stackoverflow.com/a/37573701
-    # Streaming, so we can iterate over the response.
-    response = requests.get(url, stream=True, timeout=10)
-    # Sizes in bytes.
-    total_size = int(response.headers.get("content-length", 0))
-    block_size = 1024
-    with tqdm(total=total_size, unit="B", unit_scale=True) as progress_bar:
-        with open(filepath, "wb") as file:
-            for data in response.iter_content(block_size):
-                progress_bar.update(len(data))
-                file.write(data)
 
-    if total_size != 0 and progress_bar.n != total_size:
-        raise RuntimeError("Could not download file")
+def is_check_due(tool: dict, time_delta=7) -> bool:
+    """
+    Checks if it is time to check the tool for updates.
 
-    # now extract the zip file
-    with ZipFile(filepath, "r") as zf:
-        zf.extractall(INSTALL_DIR)
+    tool: The dict of the tool.
+    time_delta: How many days to wait for between checks (default is 7).
+    """
+    return (datetime.now() - timedelta(time_delta)) > STATE.lastchecked(tool)
 
 
-def is_new_modified_date(url, dt_lastupdated, time_delta=7) -> bool:
+def check_for_update(tool: dict, time_delta=7, force=False):
     """
-    Checks if the modified date of the url is newer than the last updated.
-    
-    url: The URL you want to check.
-    dt_lastupdated: The datetime of when it was last updated.
-    time_delta: How many days to wait for (default is 7).
+    Checks if there is a new version of the tool with a conditional GET.
+    Returns the streaming response of the new version, or None if there isn't one.
+
+    The validators of the installed version (ETag and the server's own
+    Last-Modified) are sent along, so an unchanged file ends in a 304 and a
+    changed one streams straight into get_program.
+
+    tool: The dict of the tool.
+    time_delta: How many days to wait for between checks (default is 7).
+    force: Check even if it is not time to, without validators (for installing).
     """
-    if (DT_NOW - timedelta(time_delta)) > dt_lastupdated:
-        # send HEAD request for when the url was last modified
-        request_url = requests.head(url, timeout=10)
-        if request_url.ok:
-            headers = request_url.headers
-            # https://stackoverflow.com/a/71637523
-            dt_lastmodified = datetime.strptime(headers["last-modified"], "%a, %d %b %Y %H:%M:%S %Z")
-            # check date
-            if dt_lastmodified > dt_lastupdated:
-                return True
-    return False
+    if not force and not is_check_due(tool, time_delta):
+        return None
 
+    import requests
 
-def update_program(url, dt_lastupdated, file_lastupdated, first_time_install=False):
+    headers = {}
+    if not force:
+        entry = STATE.get(tool)
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        else:
+            # installed before the validators were kept, go by the last check
+            headers["If-Modified-Since"] = STATE.lastchecked(tool).strftime("%a, %d %b %Y %H:%M:%S GMT")
+
+    try:
+        response = get_session().get(tool["url"], headers=headers, stream=True, timeout=CHECK_DEADLINE)
+    except requests.RequestException as e:
+        if force:
+            raise
+        print(f"Could not check for {tool['name']} updates: {e}")
+        return None
+
+    if response.status_code == 200:
+        return response
+    if response.status_code == 304:
+        # read the (empty) body, so that closing the response gives the
+        # connection back to the session instead of closing it
+        response.content
+        # not modified, wait for the next check
+        STATE.update(tool)
+    response.close()
+    return None
+
+
+def check_for_updates(checks: list) -> dict:
     """
-    Checks for program updates.
+    Runs the update checks at the same time, so they take one round trip
+    instead of one each. Checks still running after CHECK_DEADLINE are
+    skipped, unless they are forced.
+    Returns the streaming responses of the new versions by tool name.
 
-    url: The URL of the program.
-    dt_lastupdated: The datetime of when it was last updated.
-    file_lastupdated: Where to save the datetime if an update occurs.
+    checks: A list of (tool, time_delta, force) to pass to check_for_update.
+    """
+    checks = [check for check in checks if check[2] or is_check_due(check[0], check[1])]
+    if not checks:
+        return {}
+
+    import time
+
+    # each check runs in a daemon thread of its own rather than in a
+    # ThreadPoolExecutor, whose threads are joined when the interpreter
+    # exits, so a check stuck past the deadline would still hold up the
+    # launcher. A check that answers after it was skipped closes its
+    # response itself.
+    lock = threading.Lock()
+    # (response, exception) of every check that has answered, by number
+    results = {}
+    skipped = set()
+
+    def run_check(number: int, check: tuple):
+        try:
+            result = (check_for_update(*check), None)
+        except Exception as e:
+            result = (None, e)
+        with lock:
+            if number not in skipped:
+                results[number] = result
+                return
+        if result[0] is not None:
+            result[0].close()
+
+    threads = [threading.Thread(target=run_check, args=(number, check), daemon=True)
+               for number, check in enumerate(checks)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + CHECK_DEADLINE
+    for thread, (_, _, force) in zip(threads, checks):
+        thread.join(None if force else max(0, deadline - time.monotonic()))
+
+    responses = {}
+    for number, (tool, _, force) in enumerate(checks):
+        with lock:
+            if number not in results:
+                skipped.add(number)
+                print(f"Could not check for {tool['name']} updates: timed out")
+                continue
+            response, error = results[number]
+        if error is not None:
+            raise error
+        if response is not None:
+            responses[tool["name"]] = response
+    return responses
+
+
+def update_program(tool: dict, response, first_time_install=False):
+    """
+    Installs a new version of the program.
+
+    tool: The dict of the program.
+    response: The streaming response of the new version.
     first_time_install: Skip asking to update if first time installing.
     """
-    if is_new_modified_date(url, dt_lastupdated):
-        if first_time_install:
-            pass
-        elif not query("New version is available! Would you like to update?"):
+    if not first_time_install and not query(f"New version of {tool['name']} is available! Would you like to update?"):
+        response.close()
+        # don't ask again until the next check
+        STATE.update(tool)
+        return
+    print(f"Downloading {tool['url']}...")
+    # write the download and current date to the state
+    STATE.update(tool, **get_program(tool["url"], response, STATE.get(tool).get("members")))
+
+
+def split_launcher_options(argv: list) -> tuple:
+    """
+    Takes the launcher's own options (LAUNCHER_OPTIONS) out of the command line.
+    Returns the options by name (without the dashes) and the rest of the command line.
+    """
+    options = {}
+    rest = []
+    args = iter(argv)
+    for arg in args:
+        name, has_value, value = arg.partition("=")
+        if name not in LAUNCHER_OPTIONS:
+            rest.append(arg)
+            continue
+        if LAUNCHER_OPTIONS[name] is bool:
+            options[name[2:]] = True
+            continue
+        if not has_value:
+            value = next(args, None)
+        if LAUNCHER_OPTIONS[name] is list:
+            if value is None:
+                print(f"{name} needs a value", file=sys.stderr)
+                sys.exit(2)
+            options.setdefault(name[2:], []).append(value)
+            continue
+        try:
+            options[name[2:]] = LAUNCHER_OPTIONS[name](value)
+        except (TypeError, ValueError):
+            print(f"{name} needs a {LAUNCHER_OPTIONS[name].__name__} value", file=sys.stderr)
+            sys.exit(2)
+    return options, rest
+
+
+def run_program(command: list) -> int:
+    """
+    Runs the program and returns its exit code.
+
+    Python scripts are run inside this interpreter with runpy, which saves
+    starting a second one. Set TRIDIRT_SUBPROCESS=1 to always use a subprocess.
+
+    command: The command to run.
+    """
+    if command[0] != sys.executable or os.environ.get("TRIDIRT_SUBPROCESS"):
+        import subprocess
+        return subprocess.call(command)
+
+    script = command[1]
+    old_argv, old_path = sys.argv, sys.path[0]
+    # make it look like the script was started directly
+    sys.argv = command[1:]
+    sys.path[0] = os.path.dirname(script)
+    exit_code = 0
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as e:
+        if e.code is None:
+            exit_code = 0
+        elif isinstance(e.code, int):
+            exit_code = e.code
+        else:
+            # sys.exit("message") prints the message and exits with 1
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    finally:
+        sys.argv, sys.path[0] = old_argv, old_path
+        sys.stdout.flush()
+        sys.stderr.flush()
+    return exit_code
+
+
+def update_trid_defs(response):
+    """
+    Installs new TrID definitions.
+
+    response: The streaming response of the new definitions.
+    """
+    print(f"Downloading {TRIDDEFS_DICT['url']}...")
+    # write the download and current date to the state
+    STATE.update(TRIDDEFS_DICT, **get_program(TRIDDEFS_DICT["url"], response,
+                                              STATE.get(TRIDDEFS_DICT).get("members")))
+    index_trid_defs()
+    invalidate_result_cache()
+
+
+def index_trid_defs():
+    """Saves the index of the installed definitions, so they load quickly (see engine.save_index)."""
+    from tridirt import engine
+
+    path = f"{get_program_dir()}/{TRIDDEFS_DICT['file']}"
+    try:
+        engine.save_index(engine.parse_definitions(path), path)
+    except (OSError, ValueError) as e:
+        # the definitions are then parsed every time, as before
+        print(f"Could not index {path}: {e}", file=sys.stderr)
+
+
+def invalidate_result_cache():
+    """Removes the cached results of definitions other than the installed ones."""
+    if not os.path.exists(CACHE_FILE) or not is_installed(TRIDDEFS_DICT):
+        return
+    from tridirt import cache
+
+    results = cache.ResultCache(CACHE_FILE)
+    try:
+        results.invalidate(cache.file_digest(f"{get_program_dir()}/{TRIDDEFS_DICT['file']}"))
+    finally:
+        results.close()
+
+
+def get_update_checks(tool: dict, first_time_install=False) -> list:
+    """
+    Gets the update checks for starting a program: the program itself,
+    the other installed tools and TrID's definitions.
+    Returns a list of (tool, time_delta, force) for check_for_updates.
+
+    tool: The dict of the program being started.
+    first_time_install: Force checking the program if first time installing.
+    """
+    checks = [(tool, 7, first_time_install)]
+    for other in (TRID_DICT, TRIDSCAN_DICT, TRIDDEFSPACK_DICT):
+        if other is not tool and is_installed(other):
+            checks.append((other, 7, False))
+    # if trid, check definitions, installing them if they are missing
+    if tool["name"] == "TrID" or is_installed(TRID_DICT):
+        checks.append((TRIDDEFS_DICT, 2, tool["name"] == "TrID" and not is_installed(TRIDDEFS_DICT)))  # 2 days
+    return checks
+
+
+def update_tools(tool: dict, first_time_install=False):
+    """
+    Checks the program, TrID's definitions and the other installed tools for
+    updates all at once, then installs the new versions. A download that
+    fails is reported and tried again at the next start, unless the tool is
+    being installed for the first time.
+
+    tool: The dict of the program being started.
+    first_time_install: Skip asking to update if first time installing.
+    """
+    checks = get_update_checks(tool, first_time_install)
+    responses = check_for_updates(checks)
+    for checked_tool, _, force in checks:
+        response = responses.get(checked_tool["name"])
+        if response is None:
+            continue
+        try:
+            if checked_tool is TRIDDEFS_DICT:
+                update_trid_defs(response)
+            else:
+                update_program(checked_tool, response, force)
+        except RuntimeError as e:
+            if force:
+                raise
+            # start with the installed version; it isn't marked as checked,
+            # so the next start tries again
+            print(f"Could not update {checked_tool['name']}: {e.__cause__ or e}", file=sys.stderr)
+
+
+def stage_updates(name: str):
+    """
+    Background worker for TRIDIRT_BACKGROUND_UPDATES: checks for updates
+    and downloads the new versions into STAGED_DIR without installing them.
+    apply_staged_updates installs them on the next start.
+
+    name: The name of the program being started.
+    """
+    with InstallLock(0) as locked:
+        if not locked:
+            # another launcher or worker is on it
             return
-        print(f"Downloading {url}...")
-        get_program(url)
-        # write current date to last updated
-        with open(file_lastupdated, "w", encoding="utf-8") as f:
-            f.write(DT_NOW.strftime(DT_FORMAT))
-
-
-def update_trid_defs():
-    """Checks for TrID definition updates"""
-    # check if defs are installed
-    if not os.path.exists(f"{INSTALL_DIR}/triddefs.trd"):
-        # if not, ask trid to install them
-        subprocess.call([sys.executable, f"{INSTALL_DIR}/trid.py", "--update"])
-        # write current date to last updated
-        with open(TRIDDEFS_DICT["file_lastupdated"], "w", encoding="utf-8") as f:
-            f.write(DT_NOW.strftime(DT_FORMAT))
+        STATE.reload()
+        tool = TOOLS[name]
+        checks = get_update_checks(tool)
+        responses = check_for_updates(checks)
+        for checked_tool, _, _ in checks:
+            response = responses.get(checked_tool["name"])
+            if response is None:
+                continue
+            os.makedirs(STAGED_DIR, exist_ok=True)
+            filename = checked_tool["url"].rsplit('/', maxsplit=1)[-1]
+            filepath = f"{STAGED_DIR}/{filename}"
+            fields = download_program(checked_tool["url"], filepath, response)
+            fields["file"] = filepath
+            STATE.update(checked_tool, staged=fields)
+
+
+def spawn_update_worker(tool: dict):
+    """
+    Starts stage_updates in a detached process that outlives the launcher.
+
+    tool: The dict of the program being started.
+    """
+    import subprocess
+
+    kwargs = {}
+    if os.name == "nt":
+        kwargs["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
     else:
-        if is_new_modified_date(TRIDDEFS_DICT["url"], TRIDDEFS_DICT["dt_lastupdated"], 2):  # 2 days
-            subprocess.call([sys.executable, f"{INSTALL_DIR}/trid.py", "--update"])
-            # write current date to last updated
-            with open(TRIDDEFS_DICT["file_lastupdated"], "w", encoding="utf-8") as f:
-                f.write(DT_NOW.strftime(DT_FORMAT))
+        kwargs["start_new_session"] = True
+    subprocess.Popen(
+        [sys.executable, "-c", f"from tridirt.__main__ import stage_updates; stage_updates({tool['name']!r})"],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        **kwargs
+    )
 
 
-def start_program(command: list, name: str, url_program: str, dt_lastupdated, file_lastupdated):
+def apply_staged_updates():
+    """Installs the new versions a background worker downloaded."""
+    for tool in TOOLS.values():
+        staged = STATE.get(tool).get("staged")
+        if not staged:
+            continue
+        fields = dict(staged)
+        filepath = fields.pop("file")
+        try:
+            path, members = install_program(filepath, STATE.get(tool).get("members"))
+            os.remove(filepath)
+        except FileNotFoundError:
+            # another launcher installed it first
+            continue
+        print(f"Installed new version of {tool['name']}.", file=sys.stderr)
+        STATE.update(tool, staged=None, path=path, members=members, **fields)
+        if tool is TRIDDEFS_DICT:
+            index_trid_defs()
+            invalidate_result_cache()
+
+
+def run_engine(argv: list, options: dict):
+    """
+    Identifies the files without trid.py where the command line allows:
+    with worker processes for --jobs, --recursive and --backend, or with
+    tridd if it is running. Also runs --self-test-perf, and rejects the
+    launcher's options that would otherwise be ignored.
+    Returns the exit code, or None if trid.py needs to run it.
+
+    argv: The command line, without the launcher's options.
+    options: The launcher's options.
+    """
+    backend = options.get("backend")
+    if backend is not None:
+        from tridirt import backends
+        if backend not in backends.BACKENDS:
+            print(f"--backend needs one of: {', '.join(backends.BACKENDS)}", file=sys.stderr)
+            return 2
+        if not backends.is_available(backend):
+            print(f"The {backend} backend is not installed (pip install tridirt[{backend}]).", file=sys.stderr)
+            return 2
+
+    # options that only --jobs, --recursive and --backend (or only --recursive) use
+    for names, needed in ((("no-cache", "incremental"), ("jobs", "recursive", "backend")),
+                          (("include", "exclude"), ("recursive",))):
+        given = [f"--{name}" for name in names if name in options]
+        if given and not any(options.get(name) for name in needed) and not options.get("self-test-perf"):
+            print(f"{' and '.join(given)} only work with {' or '.join(f'--{name}' for name in needed)}.",
+                  file=sys.stderr)
+            return 2
+
+    if options.get("self-test-perf"):
+        from tridirt import perf
+        return perf.run(f"{get_program_dir()}/{TRIDDEFS_DICT['file']}", options.get("jobs") or 1,
+                        [backend] if backend else None)
+
+    if options.get("jobs") or options.get("recursive") or backend:
+        from tridirt import engine
+
+        parsed = engine.parse_argv(argv)
+        if parsed is not None:
+            from tridirt import batch
+            files, num = parsed
+            if options.get("recursive"):
+                from tridirt import walk
+                # streamed to the workers as the directories are listed
+                files = walk.walk(files, options.get("include", []), options.get("exclude", []))
+            cache_path = None if options.get("no-cache") else CACHE_FILE
+            return batch.run(files, f"{get_program_dir()}/{TRIDDEFS_DICT['file']}", options.get("jobs") or 1, num,
+                             cache_path, options.get("incremental", False), backend)
+        print("--jobs, --recursive and --backend only work with file names and -n, running TrID as usual.",
+              file=sys.stderr)
+
+    # let tridd identify the files if it is running
+    if os.path.exists(SOCKET_FILE):
+        from tridirt import daemon
+        return daemon.run_client(SOCKET_FILE, argv, os.getcwd())
+    return None
+
+
+def start_program(tool: dict) -> int:
     """
     Attempts to install, update then start the program.
-    
-    command: The command to run.
-    name: The name of the program.
-    url_program: The URL for the program.
-    dt_lastupdated: The datetime of when it was last updated.
-    file_lastupdated: Where to save the datetime if an update occurs.
+    Returns the exit code of the program.
+
+    tool: The dict of the program to start.
     """
+    make_install_dir()
+
     # check if program is not installed
     first_time_install = False
-    if not os.path.exists(command[1]):
-        do_install = query(f"Not installed. Do you want to install {name}?")
+    if not is_installed(tool):
+        do_install = query(f"Not installed. Do you want to install {tool['name']}?")
         if not do_install:
             sys.exit(1)
         first_time_install = True
 
-    # update program
-    update_program(url_program,
-                   dt_lastupdated,
-                   file_lastupdated,
-                   first_time_install)
+    # see what needs doing before taking the lock, usually nothing
+    checks = get_update_checks(tool, first_time_install)
+    forced = any(force for _, _, force in checks)
+    background = os.environ.get("TRIDIRT_BACKGROUND_UPDATES") and not forced
+    due = any(force or is_check_due(checked_tool, time_delta) for checked_tool, time_delta, force in checks)
+    staged = any(STATE.get(staged_tool).get("staged") for staged_tool in TOOLS.values())
 
-    # if trid, update definitions
-    if name == "TrID":
-        update_trid_defs()
+    if staged or (due and not background):
+        # only one launcher updates at a time; the others wait a little, then
+        # start with what's installed (unless there's nothing installed yet)
+        with InstallLock(None if forced else LOCK_WAIT) as locked:
+            if locked:
+                # the launcher that had the lock may have done it all already
+                STATE.reload()
+                first_time_install = first_time_install and not is_installed(tool)
+                # install what a background worker downloaded last time
+                apply_staged_updates()
+                if not background:
+                    # update program, definitions and other tools
+                    update_tools(tool, first_time_install)
+    if due and background:
+        # start now with what's installed, check in the background
+        spawn_update_worker(tool)
 
-    # run program
     # remove first argument as it's the command name
-    sys.argv.pop(0)
-    if sys.argv:
-        command.extend(sys.argv)
+    argv = sys.argv[1:]
+    if tool["name"] == "TrID":
+        options, argv = split_launcher_options(argv)
+        exit_code = run_engine(argv, options)
+        if exit_code is not None:
+            return exit_code
+
+    # run program
+    command = get_command(tool) + argv
     # run!
-    subprocess.call(command)
+    return run_program(command)
 
 
 def trid_main():
     """Console script function for trid"""
-    # check if trid is not installed
-    start_program(
-        TRID_DICT["command"],
-        TRID_DICT["name"],
-        TRID_DICT["url"],
-        TRID_DICT["dt_lastupdated"],
-        TRID_DICT["file_lastupdated"]
-    )
+    sys.exit(start_program(TRID_DICT))
+
+
+def tridd_main():
+    """Console script function for tridd, the identification daemon (--fork for a zygote, --no-cache)"""
+    from tridirt import daemon
+
+    if not is_installed(TRIDDEFS_DICT):
+        print("TrID's definitions are not installed. Run trid to install them.")
+        sys.exit(1)
+    fork = "--fork" in sys.argv[1:]
+    cache_path = None if "--no-cache" in sys.argv[1:] else CACHE_FILE
+    sys.exit(daemon.serve(SOCKET_FILE,
+                          lambda: f"{get_program_dir()}/{TRIDDEFS_DICT['file']}",
+                          lambda: get_command(TRID_DICT)[1],
+                          fork,
+                          cache_path))
 
 
 def tridscan_main():
     """Console script function for tridscan"""
-    # check if tridscan is not installed
-    start_program(
-        TRIDSCAN_DICT["command"],
-        TRIDSCAN_DICT["name"],
-        TRIDSCAN_DICT["url"],
-        TRIDSCAN_DICT["dt_lastupdated"],
-        TRIDSCAN_DICT["file_lastupdated"]
-    )
+    sys.exit(start_program(TRIDSCAN_DICT))
 
 
 def triddefspack_main():
     """Console script function for triddefspack"""
-    # check if triddefspack is installed
-    start_program(
-        TRIDDEFSPACK_DICT["command"],
-        TRIDDEFSPACK_DICT["name"],
-        TRIDDEFSPACK_DICT["url"],
-        TRIDDEFSPACK_DICT["dt_lastupdated"],
-        TRIDDEFSPACK_DICT["file_lastupdated"]
-    )
+    sys.exit(start_program(TRIDDEFSPACK_DICT))
 
 
 # This program is free software: you can redistribute it and/or modify it under
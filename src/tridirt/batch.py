@@ -0,0 +1,207 @@
+"""tridirt.batch - Identifies many files at once, spread over several processes."""
+# Copyright (C) 2025 exurd
+# Licensed under GNU AGPLv3. See bottom of code for license information.
+
+import os
+import sys
+import itertools
+import collections
+
+from tridirt import engine
+from tridirt import cache
+from tridirt import backends
+
+# the definitions of this process, loaded once by init_worker
+_definitions = None
+_defs_path = None
+_defs_version = None
+_cache = None
+_incremental = False
+# what the backend scores several files at once with (see backends.set_up),
+# and what it uses
+_score_files = None
+_backend = None
+
+# how many files a single process identifies at once
+SERIAL_CHUNK_SIZE = 64
+
+
+def init_worker(defs_path: str, cache_path=None, incremental=False, backend=None):
+    """
+    Loads the definitions of a worker process, unless it already has them
+    (forked workers share the ones of the parent), opens the result cache
+    and sets up the backend.
+
+    defs_path: The path of the definitions file.
+    cache_path: The result cache database, or None to not use one.
+    incremental: Skip reading files whose stat is the same as last time.
+    backend: The backend to use (see backends.BACKENDS), or None for the
+        default one (see backends.default_backend).
+    """
+    global _definitions, _defs_path, _defs_version, _cache, _incremental, _score_files, _backend
+    _incremental = incremental
+    _score_files, _backend = backends.set_up(backend or backends.default_backend())
+    if _defs_path != defs_path:
+        _definitions = engine.load_definitions(defs_path)
+        # before the workers are forked, so that they share it
+        _definitions.prepare()
+        _defs_path = defs_path
+        _defs_version = cache.file_digest(defs_path)
+    if _cache is not None:
+        _cache.close()
+        _cache = None
+    if cache_path is not None:
+        # a connection can't be shared with forked workers, open a new one
+        _cache = cache.ResultCache(cache_path)
+
+
+def identify_job(job: tuple) -> tuple:
+    """
+    Identifies a file in a worker process.
+    Returns what to print to stdout and to stderr (either may be None).
+
+    job: The file name as given, its path and how many results to show.
+    """
+    try:
+        lines = cache.identify_file(job[1], _definitions, _defs_version, _cache, _incremental)
+    except OSError as e:
+        lines = e
+    return job_output(job, lines)
+
+
+def job_output(job: tuple, lines) -> tuple:
+    """Gets what to print for a job (see identify_job), given its result lines or the OSError reading it raised."""
+    filename, _, num = job
+    if isinstance(lines, OSError):
+        return None, f"Could not read {filename}: {lines.strerror}"
+    return engine.format_lines(filename, lines, num), None
+
+
+def identify_chunk(jobs: list) -> tuple:
+    """
+    Identifies a chunk of files in a worker process (see identify_job), all
+    at once if the backend can.
+    Returns the process ID of the worker, what its backend uses, and what
+    identify_job returns for each file.
+    """
+    if _score_files is None or len(jobs) == 1:
+        return os.getpid(), _backend, [identify_job(job) for job in jobs]
+    try:
+        all_lines = cache.identify_files([path for _, path, _ in jobs], _definitions, _defs_version, _cache,
+                                         _incremental, _score_files)
+    except OSError:
+        # a file couldn't be read while its strings were searched for, go
+        # one by one to find out which
+        return os.getpid(), _backend, [identify_job(job) for job in jobs]
+    return os.getpid(), _backend, [job_output(job, lines) for job, lines in zip(jobs, all_lines)]
+
+
+def iter_chunks(iterable, size: int):
+    """Yields lists of up to size items of the iterable."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def identify_files(files: list, defs_path: str, jobs: int, num=engine.DEFAULT_RESULTS, cache_path=None,
+                   incremental=False, backend=None, workers=None):
+    """
+    Identifies the files with a pool of worker processes, each loading the
+    definitions once. Yields what to print to stdout and to stderr for every
+    file, in the order of the files.
+
+    files: The file names, which may be an iterator (like walk.walk).
+    defs_path: The path of the definitions file.
+    jobs: How many worker processes to use.
+    num: How many results to show for each file.
+    cache_path: The result cache database, or None to not use one.
+    incremental: Skip reading files whose stat is the same as last time.
+    backend: The backend to use (see backends.BACKENDS), or None for the
+        default one (see backends.default_backend).
+    workers: A dict to fill with what the backend of each worker used, by
+        process ID, or None.
+    """
+    if workers is None:
+        workers = {}
+    cwd = os.getcwd()
+    work = ((filename, os.path.join(cwd, filename), num) for filename in files)
+    if jobs <= 1:
+        init_worker(defs_path, cache_path, incremental, backend)
+        for chunk in iter_chunks(work, SERIAL_CHUNK_SIZE):
+            pid, workers[pid], outputs = identify_chunk(chunk)
+            yield from outputs
+        return
+
+    import multiprocessing
+
+    # big enough chunks to keep the workers busy, small enough to spread them out
+    if hasattr(files, "__len__"):
+        chunksize = max(1, min(256, len(files) // (jobs * 4)))
+    else:
+        chunksize = 16
+    with multiprocessing.Pool(jobs, initializer=init_worker,
+                              initargs=(defs_path, cache_path, incremental, backend)) as pool:
+        # unlike Pool.imap, only take a few chunks ahead from the files, so
+        # that a walk isn't read to the end before the results come out
+        pending = collections.deque()
+        for chunk in iter_chunks(work, chunksize):
+            pending.append(pool.apply_async(identify_chunk, (chunk,)))
+            if len(pending) >= jobs * 4:
+                pid, workers[pid], outputs = pending.popleft().get()
+                yield from outputs
+        while pending:
+            pid, workers[pid], outputs = pending.popleft().get()
+            yield from outputs
+
+
+def run(files: list, defs_path: str, jobs: int, num=engine.DEFAULT_RESULTS, cache_path=None,
+        incremental=False, backend=None) -> int:
+    """
+    Identifies the files and prints the results the way trid.py does.
+    Returns the exit code.
+
+    files: The file names.
+    defs_path: The path of the definitions file.
+    jobs: How many worker processes to use.
+    num: How many results to show for each file.
+    cache_path: The result cache database, or None to not use one.
+    incremental: Skip reading files whose stat is the same as last time.
+    backend: The backend to use (see backends.BACKENDS), or None for the
+        default one (see backends.default_backend).
+    """
+    global _cache
+    init_worker(defs_path, backend=backend)
+    print(engine.format_header(_definitions), end="")
+    exit_code = 0
+    for out, err in identify_files(files, defs_path, jobs, num, cache_path, incremental, backend):
+        if err is not None:
+            print(err, file=sys.stderr)
+            exit_code = 1
+        else:
+            print()
+            print(out)
+    if _cache is not None:
+        _cache.close()
+        _cache = None
+    elif cache_path is not None:
+        # the workers added to it, keep it in size
+        results = cache.ResultCache(cache_path)
+        results.evict()
+        results.close()
+    return exit_code
+
+
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with this program. If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,268 @@
+"""tridirt.cache - Remembers the results of files by their contents."""
+# Copyright (C) 2025 exurd
+# Licensed under GNU AGPLv3. See bottom of code for license information.
+
+# The results are kept in an SQLite database, keyed by a hash of the file's
+# contents and the version of the definitions (a hash of the definitions
+# file), so identical files are only identified once. When there are more
+# than max_entries, the ones used longest ago are removed.
+#
+# For incremental scans, the database also keeps the (inode, size, mtime_ns)
+# of every file identified and the hash of its contents, by path. A file
+# whose stat hasn't changed isn't read again: its hash leads straight to
+# its results. The version of the definitions is part of the results' key,
+# so new definitions still identify every file again. Both tables live on
+# disk as B-trees, so only the pages being looked up are read into memory.
+#
+# Files bigger than MAX_HASHED_SIZE aren't hashed, as that would read all of
+# them; only what the definitions need is read (see engine.identify_stream).
+# Smaller files are hashed as they are read, keeping only their starts in
+# memory.
+# With incremental scans their results are kept under a hash of their path
+# and stat instead.
+
+import os
+import time
+import hashlib
+import sqlite3
+import functools
+import contextlib
+
+from tridirt import engine
+
+# how many results to keep by default
+MAX_ENTRIES = 1000000
+# how big a file may be to be looked up by its contents
+MAX_HASHED_SIZE = 16 * 1024 * 1024
+# how many seconds old the last use of a result has to be before a hit
+# updates it; eviction only needs to know roughly when it was used, and
+# most hits then don't write to the database at all
+LAST_USED_INTERVAL = 3600
+
+# the databases whose tables this process (or the one it was forked from)
+# has made already
+_created = set()
+
+
+def content_digest(data: bytes) -> bytes:
+    """Gets the hash of a file's contents."""
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def stream_digest(f, start=b"") -> bytes:
+    """
+    Gets the hash of an open file's contents (the same as content_digest),
+    reading the rest of it after start a window at a time.
+    """
+    digest = hashlib.blake2b(start, digest_size=16)
+    for data in iter(lambda: f.read(engine.SEARCH_WINDOW), b""):
+        digest.update(data)
+    return digest.digest()
+
+
+def stat_digest(path: str, stat: os.stat_result) -> bytes:
+    """Gets a hash of a file's path and stat, for files too big to hash."""
+    key = f"{path}\0{stat.st_ino}\0{stat.st_size}\0{stat.st_mtime_ns}"
+    return hashlib.blake2b(key.encode("utf-8", errors="surrogateescape"), digest_size=16).digest()
+
+
+def file_digest(filename: str) -> str:
+    """Gets the hash of a file, as the version of definitions."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filename, "rb") as f:
+        for data in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    The results of files, kept in an SQLite database.
+
+    filename: The database file.
+    max_entries: How many results to keep.
+
+    It may be used from any thread, but only by one at a time.
+    """
+
+    def __init__(self, filename: str, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        # several processes use it at once, so wait for each other a while
+        self._db = sqlite3.connect(filename, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._added = 0
+        if filename in _created:
+            return
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "digest BLOB NOT NULL, version TEXT NOT NULL, lines TEXT NOT NULL, last_used INTEGER NOT NULL, "
+            "PRIMARY KEY (digest, version))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, inode INTEGER NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, "
+            "digest BLOB NOT NULL) WITHOUT ROWID"
+        )
+        _created.add(filename)
+
+    def get(self, digest: bytes, version: str):
+        """Gets the result lines of the contents, or None if they aren't known."""
+        row = self._db.execute(
+            "SELECT lines, last_used FROM results WHERE digest = ? AND version = ?", (digest, version)
+        ).fetchone()
+        if row is None:
+            return None
+        now = int(time.time())
+        if row[1] < now - LAST_USED_INTERVAL:
+            with self._db:
+                self._db.execute(
+                    "UPDATE results SET last_used = ? WHERE digest = ? AND version = ?", (now, digest, version)
+                )
+        return row[0].split("\n") if row[0] else []
+
+    def put(self, digest: bytes, version: str, lines: list):
+        """Keeps the result lines of the contents."""
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                (digest, version, "\n".join(lines), int(time.time()))
+            )
+        self._added += 1
+
+    def get_file(self, path: str, stat: os.stat_result):
+        """Gets the hash of the file's contents, or None if it changed since it was kept."""
+        row = self._db.execute(
+            "SELECT inode, size, mtime_ns, digest FROM files WHERE path = ?", (path,)
+        ).fetchone()
+        if row is None or tuple(row[:3]) != (stat.st_ino, stat.st_size, stat.st_mtime_ns):
+            return None
+        return row[3]
+
+    def put_file(self, path: str, stat: os.stat_result, digest: bytes):
+        """Keeps the stat of the file and the hash of its contents."""
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                (path, stat.st_ino, stat.st_size, stat.st_mtime_ns, digest)
+            )
+
+    def invalidate(self, version: str):
+        """Removes the results of every other version of the definitions."""
+        with self._db:
+            self._db.execute("DELETE FROM results WHERE version != ?", (version,))
+
+    def evict(self):
+        """Removes the results used longest ago while there are too many."""
+        with self._db:
+            count, = self._db.execute("SELECT COUNT(*) FROM results").fetchone()
+            if count > self.max_entries:
+                self._db.execute(
+                    "DELETE FROM results WHERE rowid IN "
+                    "(SELECT rowid FROM results ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+
+    def close(self, evict=True):
+        """Closes the database, evicting first if results were added (and evict is true)."""
+        if evict and self._added:
+            self.evict()
+        self._db.close()
+
+
+def identify_files(filenames: list, definitions, version: str, cache=None, incremental=False,
+                   score_files=None) -> list:
+    """
+    Identifies the files, except those whose contents the cache knows already.
+    Returns the result lines (see engine.result_lines) of every file, or the
+    OSError reading it raised.
+
+    filenames: The files.
+    definitions: The definitions from engine.load_definitions.
+    version: The version of the definitions (file_digest of the definitions file).
+    cache: The ResultCache, or None to not use one.
+    incremental: Skip reading the files whose stat is the same as last time.
+    score_files: A function that scores all the files the cache doesn't know
+        at once (like vectorized.score_files), or None to score them one by one.
+    """
+    all_lines = [None] * len(filenames)
+    # the files to score: (number, header, search, path, stat, digest to keep the results under)
+    pending = []
+    with contextlib.ExitStack() as stack:
+        for number, filename in enumerate(filenames):
+            path = os.path.abspath(filename)
+            try:
+                if cache is not None and incremental:
+                    digest = cache.get_file(path, os.stat(path))
+                    if digest is not None:
+                        lines = cache.get(digest, version)
+                        if lines is not None:
+                            all_lines[number] = lines
+                            continue
+
+                # kept open until the files are scored, so that only their
+                # starts are held in memory; strings are searched for in the
+                # files themselves
+                f = stack.enter_context(open(filename, "rb"))
+                # the stat that goes with what was read
+                stat = os.fstat(f.fileno())
+                header = f.read(definitions.header_size)
+                search = functools.partial(engine.search_file, f)
+                if cache is None or stat.st_size > MAX_HASHED_SIZE:
+                    digest = stat_digest(path, stat) if cache is not None and incremental else None
+                else:
+                    digest = stream_digest(f, header)
+                    lines = cache.get(digest, version)
+                    if lines is not None:
+                        f.close()
+                        if incremental:
+                            cache.put_file(path, stat, digest)
+                        all_lines[number] = lines
+                        continue
+            except OSError as e:
+                all_lines[number] = e
+                continue
+            pending.append((number, header, search, path, stat, digest))
+
+        if score_files is None:
+            all_results = [engine.score(header, definitions, search) for _, header, search, *_ in pending]
+        else:
+            all_results = score_files(definitions, [file[1] for file in pending], [file[2] for file in pending])
+    for (number, _, _, path, stat, digest), results in zip(pending, all_results):
+        lines = all_lines[number] = engine.result_lines(results)
+        if digest is not None:
+            cache.put(digest, version, lines)
+            if incremental:
+                cache.put_file(path, stat, digest)
+    return all_lines
+
+
+def identify_file(filename: str, definitions: list, version: str, cache=None, incremental=False) -> list:
+    """
+    Identifies the file, unless the cache knows its contents already.
+    Returns the result lines (see engine.result_lines).
+
+    filename: The file.
+    definitions: The definitions from engine.load_definitions.
+    version: The version of the definitions (file_digest of the definitions file).
+    cache: The ResultCache, or None to not use one.
+    incremental: Skip reading the file if its stat is the same as last time.
+    """
+    lines, = identify_files([filename], definitions, version, cache, incremental)
+    if isinstance(lines, OSError):
+        raise lines
+    return lines
+
+
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with this program. If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,406 @@
+"""tridirt.daemon - Keeps TrID's definitions loaded and identifies files over a Unix socket."""
+# Copyright (C) 2025 exurd
+# Licensed under GNU AGPLv3. See bottom of code for license information.
+
+# The client sends one JSON line: {"argv": [...], "cwd": "..."}.
+# The daemon answers with JSON lines: {"out": "..."} and {"err": "..."} for
+# what to print, then {"exit": code}. It answers {"fallback": true} to
+# command lines it can't handle, which are then run by trid.py as usual.
+#
+# With fork=True the daemon is a zygote: the parent keeps the definitions
+# and the compiled trid.py, with the modules trid.py imports, and forks a
+# child for every client. The children share the parent's pages
+# copy-on-write, and run any command line, handing the ones the engine can't
+# do to the compiled trid.py. trid.py still runs from the top in the child,
+# loading its definitions package again: for those command lines the zygote
+# only saves starting Python, importing modules and compiling trid.py.
+
+import io
+import os
+import gc
+import ast
+import sys
+import json
+import time
+import socket
+import importlib
+import contextlib
+import socketserver
+import threading
+
+from tridirt import engine
+from tridirt import cache
+from tridirt import matcher
+
+# how many seconds apart the daemon evicts from the result cache
+EVICT_INTERVAL = 300
+
+
+class DefinitionsCache:
+    """
+    The loaded definitions, loaded again when the definitions file changes.
+
+    defs_path: A function that gives the path of the definitions file.
+    """
+
+    def __init__(self, defs_path):
+        self.defs_path = defs_path
+        self._lock = threading.Lock()
+        self._key = None
+        self._definitions = None
+        self._version = None
+
+    def get(self) -> list:
+        """Gets the definitions."""
+        return self.get_versioned()[0]
+
+    def get_versioned(self) -> tuple:
+        """Gets the definitions and their version (see cache.file_digest)."""
+        path = self.defs_path()
+        stat = os.stat(path)
+        key = (path, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            if key != self._key:
+                self._definitions = engine.load_definitions(path)
+                # in the zygote, so that forked children share it
+                self._definitions.prepare()
+                self._version = cache.file_digest(path)
+                self._key = key
+            return self._definitions, self._version
+
+
+def import_modules(tree: ast.Module):
+    """Imports the modules a script imports at its top level, skipping those that can't be."""
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and not node.level and node.module:
+            # the names may be submodules
+            names = [node.module] + [f"{node.module}.{alias.name}" for alias in node.names if alias.name != "*"]
+        else:
+            continue
+        for name in names:
+            try:
+                importlib.import_module(name)
+            except Exception:
+                # e.g. modules next to the script, which aren't on sys.path here
+                pass
+
+
+class ScriptCache:
+    """
+    The compiled trid.py, compiled again when the script changes, with the
+    modules it imports imported.
+
+    script_path: A function that gives the path of trid.py.
+    """
+
+    def __init__(self, script_path):
+        self.script_path = script_path
+        self._key = None
+        self._code = None
+
+    def get(self) -> tuple:
+        """Gets the path of the script and its code."""
+        path = self.script_path()
+        stat = os.stat(path)
+        key = (path, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        if key != self._key:
+            with open(path, "rb") as f:
+                tree = ast.parse(f.read(), path)
+            import_modules(tree)
+            self._code = compile(tree, path, "exec")
+            self._key = key
+        return path, self._code
+
+
+class ResultCaches:
+    """
+    The connections to the result cache, each used by one handler at a time.
+    Eviction is left to the server, every EVICT_INTERVAL seconds, rather than
+    done by every handler that added results.
+
+    cache_path: The result cache database, or None to not use one.
+    keep: Keep the connections open for the next handlers (for threads),
+        rather than closing them after each (for forked children, which
+        exit after one).
+    """
+
+    def __init__(self, cache_path, keep):
+        self.cache_path = cache_path
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._idle = []
+        self._evicted = None
+
+    @contextlib.contextmanager
+    def get(self):
+        """Gets a connection (a cache.ResultCache), or None if there is no result cache."""
+        if self.cache_path is None:
+            yield None
+            return
+        with self._lock:
+            results = self._idle.pop() if self._idle else None
+        if results is None:
+            results = cache.ResultCache(self.cache_path)
+        try:
+            yield results
+        finally:
+            if self.keep:
+                with self._lock:
+                    self._idle.append(results)
+            else:
+                results.close(evict=False)
+
+    def evict(self):
+        """Removes the results used longest ago if there are too many, at most every EVICT_INTERVAL seconds."""
+        if self.cache_path is None:
+            return
+        now = time.monotonic()
+        if self._evicted is not None and now - self._evicted < EVICT_INTERVAL:
+            return
+        self._evicted = now
+        # its own connection, so that forked children never get one that
+        # was open in the parent
+        results = cache.ResultCache(self.cache_path)
+        try:
+            results.evict()
+        finally:
+            results.close(evict=False)
+
+    def close(self):
+        """Closes the connections kept open."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for results in idle:
+            results.close(evict=False)
+
+
+class MessageWriter(io.TextIOBase):
+    """A text stream that sends what is written to it to the client."""
+
+    def __init__(self, handler, name):
+        super().__init__()
+        self.handler = handler
+        self.name = name
+
+    def writable(self):
+        return True
+
+    def write(self, s):
+        if s:
+            self.handler.send(**{self.name: s})
+        return len(s)
+
+
+def get_exit_code(e: SystemExit) -> int:
+    """Gets the exit code a SystemExit stands for."""
+    if e.code is None:
+        return 0
+    if isinstance(e.code, int):
+        return e.code
+    # sys.exit("message") prints the message and exits with 1
+    print(e.code, file=sys.stderr)
+    return 1
+
+
+class Handler(socketserver.StreamRequestHandler):
+    """Handles one trid command line."""
+
+    def send(self, **message):
+        """Sends a message to the client."""
+        self.wfile.write(json.dumps(message).encode("utf-8") + b"\n")
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            parsed = engine.parse_argv(request["argv"])
+        except (ValueError, KeyError, TypeError):
+            return
+        if parsed is None:
+            if self.server.scripts is None:
+                self.send(fallback=True)
+            else:
+                self.run_script(request)
+            return
+        files, num = parsed
+
+        definitions, version = self.server.definitions.get_versioned()
+        self.send(out=engine.format_header(definitions))
+        exit_code = 0
+        with self.server.results.get() as results:
+            for filename in files:
+                try:
+                    lines = cache.identify_file(os.path.join(request["cwd"], filename), definitions, version, results)
+                except OSError as e:
+                    self.send(err=f"Could not read {filename}: {e.strerror}\n")
+                    exit_code = 1
+                    continue
+                self.send(out="\n" + engine.format_lines(filename, lines, num) + "\n")
+        self.send(exit=exit_code)
+
+    def run_script(self, request):
+        """Runs the command line with the preloaded trid.py (in a forked child)."""
+        path, code = self.server.scripts.get()
+        os.chdir(request["cwd"])
+        sys.argv = [path] + request["argv"]
+        sys.path[0] = os.path.dirname(path)
+        sys.stdout = MessageWriter(self, "out")
+        sys.stderr = MessageWriter(self, "err")
+        exit_code = 0
+        try:
+            exec(code, {"__name__": "__main__", "__file__": path, "__builtins__": __builtins__})
+        except SystemExit as e:
+            exit_code = get_exit_code(e)
+        finally:
+            sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+        self.send(exit=exit_code)
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """The daemon's server, handling each client in a thread."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, definitions, cache_path=None):
+        self.definitions = definitions
+        self.results = ResultCaches(cache_path, keep=True)
+        # only forked children can run trid.py, as it changes the whole process
+        self.scripts = None
+        super().__init__(socket_path, Handler)
+
+    def service_actions(self):
+        super().service_actions()
+        self.results.evict()
+
+
+class ForkingServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    """The daemon's server as a zygote, handling each client in a forked child."""
+
+    def __init__(self, socket_path, definitions, scripts, cache_path=None):
+        self.definitions = definitions
+        self.scripts = scripts
+        self.results = ResultCaches(cache_path, keep=False)
+        super().__init__(socket_path, Handler)
+
+    def service_actions(self):
+        super().service_actions()
+        self.results.evict()
+
+    def process_request(self, request, client_address):
+        # bring the definitions and trid.py up to date here, so that the
+        # children don't each load them again
+        self.definitions.get()
+        self.scripts.get()
+        # look for stringzilla once, not in every child
+        matcher.get_contains()
+        # keep the loaded objects out of garbage collection, which would
+        # otherwise write to (and so copy) their shared pages in the children
+        gc.freeze()
+        super().process_request(request, client_address)
+
+
+def connect(socket_path: str):
+    """Connects to the daemon. Returns the socket, or None if it isn't running."""
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(socket_path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def serve(socket_path: str, defs_path, script_path=None, fork=False, cache_path=None) -> int:
+    """
+    Runs the daemon until it is interrupted.
+    Returns the exit code.
+
+    socket_path: Where to make the Unix socket.
+    defs_path: A function that gives the path of the definitions file.
+    script_path: A function that gives the path of trid.py (for fork).
+    fork: Fork a child for every client, which can run any command line.
+    cache_path: The result cache database, or None to not use one.
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        print("tridd needs Unix sockets, which are not supported here.")
+        return 1
+    if fork and not hasattr(os, "fork"):
+        print("tridd --fork needs fork(), which is not supported here.")
+        return 1
+    sock = connect(socket_path)
+    if sock is not None:
+        sock.close()
+        print(f"tridd is already running on {socket_path}")
+        return 1
+    if os.path.exists(socket_path):
+        # left behind by a daemon that didn't shut down
+        os.remove(socket_path)
+
+    definitions = DefinitionsCache(defs_path)
+    print(f"Definitions found:  {len(definitions.get())}")
+    old_umask = os.umask(0o077)
+    try:
+        if fork:
+            server = ForkingServer(socket_path, definitions, ScriptCache(script_path), cache_path)
+        else:
+            server = Server(socket_path, definitions, cache_path)
+    finally:
+        os.umask(old_umask)
+    print(f"Listening on {socket_path}")
+    try:
+        # also makes the tables here, so that forked children don't
+        server.results.evict()
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.results.close()
+        os.remove(socket_path)
+    return 0
+
+
+def run_client(socket_path: str, argv: list, cwd: str):
+    """
+    Has the daemon run a trid command line, if it is running and can.
+    Returns the exit code, or None if trid.py needs to run it.
+
+    socket_path: The Unix socket of the daemon.
+    argv: The arguments of the command line.
+    cwd: The directory the file names are relative to.
+    """
+    sock = connect(socket_path)
+    if sock is None:
+        return None
+    with sock, sock.makefile("rwb") as f:
+        f.write(json.dumps({"argv": argv, "cwd": cwd}).encode("utf-8") + b"\n")
+        f.flush()
+        for line in f:
+            message = json.loads(line)
+            if message.get("fallback"):
+                return None
+            if "out" in message:
+                sys.stdout.write(message["out"])
+            if "err" in message:
+                sys.stderr.write(message["err"])
+            if "exit" in message:
+                sys.stdout.flush()
+                return message["exit"]
+    # the daemon went away halfway
+    return 1
+
+
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with this program. If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,633 @@
+"""tridirt.engine - Identifies files with TrID's definitions, without trid.py."""
+# Copyright (C) 2025 exurd
+# Licensed under GNU AGPLv3. See bottom of code for license information.
+
+# triddefs.trd is a RIFF file of form type "TRID". Every definition is a
+# "DEF " chunk, holding a "DATA" chunk with the patterns and strings and an
+# "INFO" chunk with the text fields. Numbers are little-endian.
+#
+#   "PATT": u16 count, then count times: u16 position, u16 length, bytes
+#   "STRN": u16 count, then count times: u16 length, bytes
+#   "TYPE", "EXT ", "MIME": text (extensions are separated with "/")
+#
+# A definition scores the length of every pattern it matches (1000 times
+# that for patterns at the start of the file), plus 500 times the length of
+# every string it finds in the file. Strings are upper case, matched against
+# the upper-cased file. A definition with a pattern or string missing scores
+# nothing. Chunks that aren't known are skipped.
+#
+# Patterns only ever look at the start of the file, up to the end of the
+# furthest pattern of any definition (Definitions.header_size), so files are
+# identified from that much of them. Only when a definition matched all its
+# patterns and has strings is the rest of the file searched, a window at a
+# time. Positions count from the start of the file, so no definition needs
+# the end of it.
+#
+# Parsing a package takes a while, so after installing one the launcher
+# saves the parsed arrays next to it, as <package>.idx (see save_index).
+# All numbers are little-endian:
+#
+#   INDEX_HEADER: INDEX_MAGIC, INDEX_FORMAT, header_size, the size and
+#     mtime_ns of the package, and the number of sections
+#   sections: u8 typecode, u32 length, the array or bytes, padded to 8
+#
+# The sections are the arrays of Definitions, with each list of bytes kept
+# as an array of offsets and the bytes joined, and the text fields joined
+# with "\0". Loading them copies the arrays out of a memory map in bulk,
+# but still splits the joined bytes and text into a bytes or str object per
+# pattern, string and text field (most of the time loading takes), as the
+# rest of the engine works on lists of them. An index whose package has
+# changed since is ignored.
+#
+# Most definitions have a pattern at position 0, which the first bytes of a
+# file have to match. Definitions are grouped by the first DISPATCH_BYTES
+# bytes of that pattern (Definitions.candidates), so a file is only scored
+# against the groups of its own first bytes and the definitions without one.
+
+import os
+import sys
+import array
+import struct
+import itertools
+
+from tridirt import matcher
+
+# chunks that hold other chunks
+CONTAINER_CHUNKS = (b"TRDF", b"DEF ", b"DATA", b"INFO")
+# the text chunks of a definition, and the list of Definitions they go into
+TEXT_CHUNKS = {b"TYPE": "filetypes", b"EXT ": "exts", b"MIME": "mimes"}
+
+# how many results trid.py shows by default
+DEFAULT_RESULTS = 5
+# how much of a file to search for strings at a time
+SEARCH_WINDOW = 1024 * 1024
+
+# what the index of a package is saved as, after the package's name
+INDEX_SUFFIX = ".idx"
+INDEX_MAGIC = b"TRIDIDX\0"
+# changed whenever the layout of the index changes
+INDEX_FORMAT = 1
+INDEX_HEADER = struct.Struct("<8sIIQqI")
+INDEX_SECTION = struct.Struct("<cI")
+# how many of the first bytes of a file pick the definitions to score
+DISPATCH_BYTES = 4
+
+
+class Definitions:
+    """
+    The definitions of a definitions package, kept in flat arrays rather than
+    an object each: definition i has patterns pattern_index[i] up to
+    pattern_index[i + 1], and strings string_index[i] up to string_index[i + 1].
+    Indexing or iterating gives Definition views.
+    """
+
+    __slots__ = ("filetypes", "exts", "mimes", "pattern_index", "pattern_positions", "patterns",
+                 "string_index", "strings", "header_size", "buckets")
+
+    def __init__(self):
+        self.filetypes = []
+        self.exts = []
+        self.mimes = []
+        self.pattern_index = array.array("I", [0])
+        self.pattern_positions = array.array("H")
+        self.patterns = []
+        self.string_index = array.array("I", [0])
+        # upper case
+        self.strings = []
+        # how much of the start of a file the patterns need
+        self.header_size = 0
+        # the indexes of the definitions by the start of their pattern at
+        # position 0 (b"" for none), made when first needed
+        self.buckets = None
+
+    def __len__(self):
+        return len(self.filetypes)
+
+    def __getitem__(self, index: int):
+        if not -len(self) <= index < len(self):
+            raise IndexError("definition index out of range")
+        return Definition(self, index % len(self))
+
+    def __iter__(self):
+        return (Definition(self, index) for index in range(len(self)))
+
+    def add(self):
+        """Starts a new definition, which the patterns and strings added next go into."""
+        self.filetypes.append("")
+        self.exts.append("")
+        self.mimes.append("")
+        self.pattern_index.append(len(self.patterns))
+        self.string_index.append(len(self.strings))
+        self.buckets = None
+
+    def add_pattern(self, position: int, pattern: bytes):
+        """Adds a pattern to the last definition."""
+        self.pattern_positions.append(position)
+        self.patterns.append(pattern)
+        self.pattern_index[-1] = len(self.patterns)
+        self.header_size = max(self.header_size, position + len(pattern))
+        self.buckets = None
+
+    def add_string(self, string: bytes):
+        """Adds a string to the last definition."""
+        self.strings.append(string.upper())
+        self.string_index[-1] = len(self.strings)
+
+    def make_buckets(self) -> dict:
+        """Groups the definitions by the first DISPATCH_BYTES bytes of their pattern at position 0."""
+        buckets = {}
+        positions = self.pattern_positions
+        patterns = self.patterns
+        pattern_index = self.pattern_index
+        for index in range(len(self)):
+            key = b""
+            for k in range(pattern_index[index], pattern_index[index + 1]):
+                if positions[k] == 0:
+                    key = patterns[k][:DISPATCH_BYTES]
+                    break
+            buckets.setdefault(key, []).append(index)
+        return buckets
+
+    def prepare(self):
+        """
+        Makes what identifying files needs up front, rather than on the first
+        file, e.g. so that forked processes share it instead of each making it.
+        """
+        if self.buckets is None:
+            self.buckets = self.make_buckets()
+
+    def candidates(self, header: bytes) -> list:
+        """
+        Gets the indexes of the definitions that can match a file starting
+        with header, in order: the ones whose pattern at position 0 starts
+        like the file, and the ones without a pattern at position 0.
+        """
+        self.prepare()
+        prefix = bytes(header[:DISPATCH_BYTES])
+        keys = {prefix[:length] for length in range(DISPATCH_BYTES + 1)}
+        found = [self.buckets[key] for key in keys if key in self.buckets]
+        if len(found) == 1:
+            return found[0]
+        return sorted(itertools.chain.from_iterable(found))
+
+
+class Definition:
+    """A view of one of the definitions."""
+
+    __slots__ = ("definitions", "index")
+
+    def __init__(self, definitions: Definitions, index: int):
+        self.definitions = definitions
+        self.index = index
+
+    @property
+    def filetype(self) -> str:
+        return self.definitions.filetypes[self.index]
+
+    @property
+    def ext(self) -> str:
+        return self.definitions.exts[self.index]
+
+    @property
+    def mime(self) -> str:
+        return self.definitions.mimes[self.index]
+
+    @property
+    def patterns(self) -> list:
+        """The (position, bytes) of the patterns."""
+        definitions = self.definitions
+        start, end = definitions.pattern_index[self.index], definitions.pattern_index[self.index + 1]
+        return list(zip(definitions.pattern_positions[start:end], definitions.patterns[start:end]))
+
+    @property
+    def strings(self) -> list:
+        definitions = self.definitions
+        return definitions.strings[definitions.string_index[self.index]:definitions.string_index[self.index + 1]]
+
+
+class Result:
+    """A definition that matched a file."""
+
+    __slots__ = ("definition", "points", "percent")
+
+    def __init__(self, definition, points, percent=0.0):
+        self.definition = definition
+        self.points = points
+        self.percent = percent
+
+
+def iter_chunks(data: bytes, start: int, end: int):
+    """Yields the (id, start, end) of the RIFF chunks between start and end."""
+    pos = start
+    while pos + 8 <= end:
+        chunk_id = data[pos:pos + 4]
+        size, = struct.unpack_from("<I", data, pos + 4)
+        chunk_start = pos + 8
+        chunk_end = min(chunk_start + size, end)
+        yield chunk_id, chunk_start, chunk_end
+        # chunks are padded to an even size
+        pos = chunk_end + (size & 1)
+
+
+def skip(pos: int, end: int, size: int) -> int:
+    """
+    Skips over size bytes at pos, which must be inside the chunk ending at end.
+    Returns the position after them.
+    """
+    if pos + size > end:
+        raise ValueError(f"chunk data at offset {pos} runs past the end of its chunk")
+    return pos + size
+
+
+def parse_patterns(data: bytes, start: int, end: int, definitions: Definitions):
+    """Parses a "PATT" chunk into the last definition."""
+    pos = skip(start, end, 2)
+    count, = struct.unpack_from("<H", data, start)
+    for _ in range(count):
+        pattern_start = skip(pos, end, 4)
+        position, length = struct.unpack_from("<HH", data, pos)
+        pos = skip(pattern_start, end, length)
+        definitions.add_pattern(position, data[pattern_start:pos])
+
+
+def parse_strings(data: bytes, start: int, end: int, definitions: Definitions):
+    """Parses a "STRN" chunk into the last definition."""
+    pos = skip(start, end, 2)
+    count, = struct.unpack_from("<H", data, start)
+    for _ in range(count):
+        string_start = skip(pos, end, 2)
+        length, = struct.unpack_from("<H", data, pos)
+        pos = skip(string_start, end, length)
+        definitions.add_string(data[string_start:pos])
+
+
+def parse_definition(data: bytes, start: int, end: int, definitions: Definitions):
+    """Parses the chunks of a "DEF " chunk into the last definition."""
+    for chunk_id, chunk_start, chunk_end in iter_chunks(data, start, end):
+        if chunk_id in CONTAINER_CHUNKS:
+            parse_definition(data, chunk_start, chunk_end, definitions)
+        elif chunk_id == b"PATT":
+            parse_patterns(data, chunk_start, chunk_end, definitions)
+        elif chunk_id == b"STRN":
+            parse_strings(data, chunk_start, chunk_end, definitions)
+        elif chunk_id in TEXT_CHUNKS:
+            text = data[chunk_start:chunk_end].rstrip(b"\0").decode("utf-8", errors="replace")
+            getattr(definitions, TEXT_CHUNKS[chunk_id])[-1] = text
+
+
+def parse_chunks(data: bytes, start: int, end: int, definitions: Definitions):
+    """Parses the definitions in the chunks between start and end."""
+    for chunk_id, chunk_start, chunk_end in iter_chunks(data, start, end):
+        if chunk_id == b"DEF ":
+            definitions.add()
+            parse_definition(data, chunk_start, chunk_end, definitions)
+        elif chunk_id in CONTAINER_CHUNKS:
+            parse_chunks(data, chunk_start, chunk_end, definitions)
+
+
+def parse_definitions(filename: str) -> Definitions:
+    """Parses the definitions of a TrID definitions package (triddefs.trd)."""
+    with open(filename, "rb") as f:
+        data = f.read()
+    if data[:4] != b"RIFF" or data[8:12] != b"TRID":
+        raise ValueError(f"{filename} is not a TrID definitions package")
+    definitions = Definitions()
+    try:
+        parse_chunks(data, 12, len(data), definitions)
+    except (ValueError, struct.error) as e:
+        raise ValueError(f"{filename} is damaged or laid out differently: {e}") from None
+    return definitions
+
+
+def pack_bytes(items: list) -> tuple:
+    """Packs a list of bytes into an array of offsets and the bytes joined."""
+    offsets = array.array("I", [0])
+    offsets.extend(itertools.accumulate(len(item) for item in items))
+    return offsets, b"".join(items)
+
+
+def unpack_bytes(offsets, data: bytes) -> list:
+    """Unpacks a list of bytes packed with pack_bytes."""
+    return [data[start:end] for start, end in zip(offsets, itertools.islice(offsets, 1, None))]
+
+
+def pack_text(texts: list) -> bytes:
+    """Packs a list of text fields."""
+    if any("\0" in text for text in texts):
+        raise ValueError("text fields can't be indexed")
+    return "\0".join(texts).encode("utf-8", errors="surrogateescape")
+
+
+def unpack_text(data: bytes, count: int) -> list:
+    """Unpacks a list of count text fields packed with pack_text."""
+    return data.decode("utf-8", errors="surrogateescape").split("\0") if count else []
+
+
+def save_index(definitions: Definitions, filename: str):
+    """
+    Saves the definitions as the index of the package they were parsed from,
+    which load_definitions then loads instead.
+
+    definitions: The definitions from parse_definitions.
+    filename: The path of the package.
+    """
+    stat = os.stat(filename)
+    pattern_offsets, pattern_data = pack_bytes(definitions.patterns)
+    string_offsets, string_data = pack_bytes(definitions.strings)
+    sections = [definitions.pattern_index, definitions.pattern_positions, pattern_offsets, pattern_data,
+                definitions.string_index, string_offsets, string_data, pack_text(definitions.filetypes),
+                pack_text(definitions.exts), pack_text(definitions.mimes)]
+
+    index_filename = filename + INDEX_SUFFIX
+    tmp_filename = f"{index_filename}.{os.getpid()}"
+    try:
+        with open(tmp_filename, "wb") as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_FORMAT, definitions.header_size,
+                                      stat.st_size, stat.st_mtime_ns, len(sections)))
+            for section in sections:
+                if isinstance(section, array.array):
+                    typecode = section.typecode.encode("ascii")
+                    if sys.byteorder != "little":
+                        section = array.array(section.typecode, section)
+                        section.byteswap()
+                    data = section.tobytes()
+                else:
+                    typecode, data = b"B", section
+                f.write(INDEX_SECTION.pack(typecode, len(data)))
+                f.write(data)
+                f.write(bytes(-(INDEX_SECTION.size + len(data)) % 8))
+        # readers see the old index or the new one, never half of one
+        os.replace(tmp_filename, index_filename)
+    except BaseException:
+        try:
+            os.remove(tmp_filename)
+        except OSError:
+            pass
+        raise
+
+
+def load_index(filename: str):
+    """
+    Loads the definitions of a package from its index (see save_index).
+    Returns the definitions, or None if there is no index or it is out of date.
+    """
+    import mmap
+
+    try:
+        stat = os.stat(filename)
+        f = open(filename + INDEX_SUFFIX, "rb")
+    except OSError:
+        return None
+    with f:
+        try:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # empty
+            return None
+    with m:
+        try:
+            magic, index_format, header_size, size, mtime_ns, count = INDEX_HEADER.unpack_from(m, 0)
+            if (magic, index_format, size, mtime_ns) != (INDEX_MAGIC, INDEX_FORMAT, stat.st_size, stat.st_mtime_ns):
+                return None
+            sections = []
+            pos = INDEX_HEADER.size
+            for _ in range(count):
+                typecode, length = INDEX_SECTION.unpack_from(m, pos)
+                start = pos + INDEX_SECTION.size
+                if start + length > len(m):
+                    return None
+                if typecode == b"B":
+                    section = m[start:start + length]
+                else:
+                    section = array.array(typecode.decode("ascii"))
+                    section.frombytes(m[start:start + length])
+                    if sys.byteorder != "little":
+                        section.byteswap()
+                sections.append(section)
+                pos = start + length + (-(INDEX_SECTION.size + length) % 8)
+        except (struct.error, ValueError):
+            return None
+    if len(sections) != 10:
+        return None
+
+    (pattern_index, pattern_positions, pattern_offsets, pattern_data,
+     string_index, string_offsets, string_data, filetypes, exts, mimes) = sections
+    definitions = Definitions()
+    count = len(pattern_index) - 1
+    definitions.filetypes = unpack_text(filetypes, count)
+    definitions.exts = unpack_text(exts, count)
+    definitions.mimes = unpack_text(mimes, count)
+    definitions.pattern_index = pattern_index
+    definitions.pattern_positions = pattern_positions
+    definitions.patterns = unpack_bytes(pattern_offsets, pattern_data)
+    definitions.string_index = string_index
+    definitions.strings = unpack_bytes(string_offsets, string_data)
+    definitions.header_size = header_size
+    if not (len(definitions.exts) == len(definitions.mimes) == len(definitions.filetypes) == count
+            == len(string_index) - 1 and len(definitions.patterns) == len(pattern_positions)):
+        return None
+    return definitions
+
+
+def load_definitions(filename: str) -> Definitions:
+    """
+    Loads the definitions from a TrID definitions package (triddefs.trd),
+    from its index if it has an up-to-date one.
+    """
+    definitions = load_index(filename)
+    if definitions is None:
+        definitions = parse_definitions(filename)
+    return definitions
+
+
+# the definitions identify() uses when it isn't given any
+_default_definitions = None
+
+
+def get_default_definitions() -> Definitions:
+    """Gets the definitions installed by the launcher, loading them the first time."""
+    global _default_definitions
+    if _default_definitions is None:
+        from tridirt.__main__ import get_program_dir, TRIDDEFS_DICT
+        _default_definitions = load_definitions(f"{get_program_dir()}/{TRIDDEFS_DICT['file']}")
+    return _default_definitions
+
+
+def score(header: bytes, definitions: Definitions, search) -> list:
+    """
+    Scores the definitions against a file.
+    Returns the results, the most likely first.
+
+    header: The start of the file, at least as long as its patterns need.
+    definitions: The definitions from load_definitions.
+    search: A function that gets which of a set of strings are in the upper-cased file.
+    """
+    pattern_index = definitions.pattern_index
+    positions = definitions.pattern_positions
+    patterns = definitions.patterns
+    string_index = definitions.string_index
+    strings = definitions.strings
+
+    # the definitions that matched all their patterns, and their points so far
+    matched = []
+    needed = set()
+    for index in definitions.candidates(header):
+        start, end = pattern_index[index], pattern_index[index + 1]
+        points = 0
+        if start != end:
+            # most definitions already fail on their first pattern
+            position = positions[start]
+            pattern = patterns[start]
+            if header[position:position + len(pattern)] != pattern:
+                continue
+            points = len(pattern) * (1000 if position == 0 else 1)
+        for k in range(start + 1, end):
+            position = positions[k]
+            pattern = patterns[k]
+            if header[position:position + len(pattern)] != pattern:
+                break
+            points += len(pattern) * (1000 if position == 0 else 1)
+        else:
+            string_start, string_end = string_index[index], string_index[index + 1]
+            if string_start != string_end:
+                needed.update(strings[string_start:string_end])
+            elif not points:
+                continue
+            matched.append((index, points))
+    return rank(definitions, matched, needed, search)
+
+
+def rank(definitions: Definitions, matched: list, needed: set, search) -> list:
+    """
+    Scores the strings of the definitions that matched all their patterns.
+    Returns the results, the most likely first.
+
+    definitions: The definitions from load_definitions.
+    matched: The (index, points of the patterns) of the definitions that
+        matched, in the order of the definitions.
+    needed: The strings of those definitions.
+    search: A function that gets which of a set of strings are in the upper-cased file.
+    """
+    strings = definitions.strings
+    string_index = definitions.string_index
+    found = search(needed) if needed else set()
+    results = []
+    for index, points in matched:
+        definition_strings = strings[string_index[index]:string_index[index + 1]]
+        if not all(string in found for string in definition_strings):
+            continue
+        points += sum(len(string) * 500 for string in definition_strings)
+        results.append(Result(Definition(definitions, index), points))
+
+    total = sum(result.points for result in results)
+    for result in results:
+        result.percent = result.points * 100 / total
+    results.sort(key=lambda result: result.points, reverse=True)
+    return results
+
+
+def identify(data, definitions=None) -> list:
+    """
+    Identifies the file.
+    Returns the results, the most likely first.
+
+    data: The contents of the file, or its path.
+    definitions: The definitions from load_definitions, or None for the
+        installed ones.
+    """
+    if definitions is None:
+        definitions = get_default_definitions()
+    if not isinstance(data, (bytes, bytearray, memoryview)):
+        return identify_file(data, definitions)
+
+    return score(data, definitions, lambda strings: matcher.find_strings([data], strings))
+
+
+def search_file(f, strings: set) -> set:
+    """
+    Gets which of the (upper case) strings are in the upper-cased file,
+    reading it a window at a time.
+    """
+    f.seek(0)
+    return matcher.find_strings(iter(lambda: f.read(SEARCH_WINDOW), b""), strings)
+
+
+def identify_stream(f, definitions: Definitions) -> list:
+    """
+    Identifies an open binary file, reading only the start of it unless
+    definitions with strings need more.
+    Returns the results, the most likely first.
+    """
+    header = f.read(definitions.header_size)
+    return score(header, definitions, lambda strings: search_file(f, strings))
+
+
+def identify_file(filename, definitions: Definitions) -> list:
+    """Identifies the file. Returns the results, the most likely first."""
+    with open(os.fspath(filename), "rb") as f:
+        return identify_stream(f, definitions)
+
+
+def parse_argv(argv: list):
+    """
+    Parses a trid command line.
+    Returns the files and how many results to show, or None if it has
+    options that only trid.py knows.
+    """
+    files = []
+    num = DEFAULT_RESULTS
+    args = iter(argv)
+    for arg in args:
+        if arg == "-n":
+            try:
+                num = int(next(args))
+            except (StopIteration, ValueError):
+                return None
+        elif arg.startswith("-") or any(c in arg for c in "*?["):
+            # other options, and wildcards trid.py would expand itself
+            return None
+        else:
+            files.append(arg)
+    if not files:
+        return None
+    return files, num
+
+
+def format_header(definitions: list) -> str:
+    """Formats what trid.py prints before the results."""
+    return f"Definitions found:  {len(definitions)}\nAnalyzing...\n"
+
+
+def result_lines(results: list) -> list:
+    """Formats the results of a file the way trid.py prints them, a line each."""
+    lines = []
+    for result in results:
+        definition = result.definition
+        lines.append(f"{result.percent:5.1f}% (.{definition.ext}) {definition.filetype} "
+                     f"({result.points}/{len(definition.patterns)}/{len(definition.strings)})")
+    return lines
+
+
+def format_lines(filename: str, lines: list, num=DEFAULT_RESULTS) -> str:
+    """Formats the result lines of a file, with the name of the file first."""
+    if not lines:
+        lines = [" Unknown!"]
+    return "\n".join([f"Collecting data from file: {filename}"] + lines[:num])
+
+
+def format_results(filename: str, results: list, num=DEFAULT_RESULTS) -> str:
+    """Formats the results of a file the way trid.py prints them."""
+    return format_lines(filename, result_lines(results[:num]), num)
+
+
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with this program. If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,189 @@
+"""tridirt.matcher - Finds which of a set of strings are in a file."""
+# Copyright (C) 2025 exurd
+# Licensed under GNU AGPLv3. See bottom of code for license information.
+
+# The strings of the definitions are upper case and matched against the
+# upper-cased file. A file is searched a window at a time, either:
+#
+# - for each string on its own, with bytes.__contains__ (or stringzilla's
+#   contains, if it is installed) on the upper-cased window, keeping the end
+#   of the last window for strings that span two, or
+# - for all the strings at once, with an Aho-Corasick automaton that goes
+#   over the file a byte at a time and carries its state from one window to
+#   the next.
+#
+# Searching for a string with contains costs about the same as going over
+# the data once, but in C; the automaton goes over it once in Python, which
+# is much slower per byte but doesn't depend on the number of strings. It is
+# used from AUTOMATON_MIN_STRINGS strings on (more with stringzilla, whose
+# contains is faster still); benchmarks/bench_matcher.py measures where.
+#
+# The automaton is a table of transitions, a row per state and a column per
+# symbol. Bytes are turned into symbols with bytes.translate first, which
+# folds lower case into upper case, and gives every byte that isn't in any
+# string symbol 0, keeping the rows short. Automatons are made for the set
+# of strings a file needs, and kept for the next files needing the same set (files of the same
+# type need the same strings).
+
+import functools
+
+# from how many strings to use the automaton
+AUTOMATON_MIN_STRINGS = 96
+# the same, when stringzilla is installed
+STRINGZILLA_AUTOMATON_MIN_STRINGS = 2048
+# how many automatons to keep
+AUTOMATON_CACHE_SIZE = 16
+
+# stringzilla's contains, or bytes.__contains__ if it isn't installed, looked
+# up the first time it is needed
+_contains = None
+
+
+def get_contains():
+    """
+    Gets the function that checks if data contains a string: stringzilla's
+    if it is installed, or bytes.__contains__.
+    """
+    global _contains
+    if _contains is None:
+        try:
+            import stringzilla
+        except ImportError:
+            _contains = bytes.__contains__
+        else:
+            _contains = stringzilla.contains
+    return _contains
+
+
+def use_stringzilla(use: bool):
+    """Makes searches use stringzilla's contains (which must be installed), or bytes.__contains__."""
+    global _contains
+    if use:
+        import stringzilla
+        _contains = stringzilla.contains
+    else:
+        _contains = bytes.__contains__
+
+
+class Automaton:
+    """
+    An Aho-Corasick automaton that finds which of a set of (upper case)
+    strings are in data, in one pass over it.
+    """
+
+    __slots__ = ("symbols", "table", "matches")
+
+    def __init__(self, strings):
+        alphabet = sorted({c for string in strings for c in string})
+        symbol_of = {c: symbol for symbol, c in enumerate(alphabet, 1)}
+        symbols = bytearray(256)
+        for c in range(256):
+            symbols[c] = symbol_of.get(c - 32 if 97 <= c <= 122 else c, 0)
+        # bytes to symbols for bytes.translate
+        self.symbols = bytes(symbols)
+        width = len(alphabet) + 1
+
+        # the trie of the strings: the transitions of each state, and the
+        # strings that end there
+        trie = [{}]
+        ends = [()]
+        for string in strings:
+            state = 0
+            for c in string:
+                symbol = symbol_of[c]
+                next_state = trie[state].get(symbol)
+                if next_state is None:
+                    next_state = len(trie)
+                    trie[state][symbol] = next_state
+                    trie.append({})
+                    ends.append(())
+                state = next_state
+            ends[state] += (string,)
+
+        # fill in the transitions the trie doesn't have with those of the
+        # state a mismatch falls back to, which is always nearer the root,
+        # so states are done breadth-first
+        table = [None] * len(trie)
+        table[0] = [0] * width
+        for symbol, next_state in trie[0].items():
+            table[0][symbol] = next_state
+        fallbacks = [0] * len(trie)
+        queue = list(trie[0].values())
+        for state in queue:
+            fallback = fallbacks[state]
+            ends[state] += ends[fallback]
+            row = table[state] = table[fallback][:]
+            for symbol, next_state in trie[state].items():
+                fallbacks[next_state] = table[fallback][symbol]
+                row[symbol] = next_state
+                queue.append(next_state)
+        self.table = table
+        # the strings found on reaching each state
+        self.matches = ends
+
+    def search(self, data: bytes, found: set, state=0) -> int:
+        """
+        Adds the strings in data to found.
+        Returns the state to continue with in the data right after it.
+        """
+        table = self.table
+        matches = self.matches
+        for symbol in bytes(data).translate(self.symbols):
+            state = table[state][symbol]
+            if matches[state]:
+                found.update(matches[state])
+        return state
+
+
+@functools.lru_cache(maxsize=AUTOMATON_CACHE_SIZE)
+def get_automaton(strings: frozenset) -> Automaton:
+    """Gets the automaton for the set of strings."""
+    return Automaton(strings)
+
+
+def find_strings(windows, strings: set) -> set:
+    """
+    Gets which of the (upper case) strings are in the upper-cased data.
+
+    windows: The data, as an iterable of consecutive parts of it. It is
+        only iterated until all the strings are found.
+    strings: The strings to look for.
+    """
+    found = {string for string in strings if not string}
+    remaining = strings - found
+    contains = get_contains()
+    min_strings = AUTOMATON_MIN_STRINGS if contains is bytes.__contains__ else STRINGZILLA_AUTOMATON_MIN_STRINGS
+    if len(remaining) >= min_strings:
+        automaton = get_automaton(frozenset(remaining))
+        state = 0
+        for window in windows:
+            state = automaton.search(window, found, state)
+            if len(found) == len(strings):
+                break
+        return found
+
+    # keep the end of the last window, for strings that span two
+    overlap = max((len(string) for string in remaining), default=1) - 1
+    tail = b""
+    for data in windows:
+        if not remaining:
+            break
+        window = tail + bytes(data).upper()
+        for string in [string for string in remaining if contains(window, string)]:
+            found.add(string)
+            remaining.discard(string)
+        tail = window[max(0, len(window) - overlap):] if overlap else b""
+    return found
+
+
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with this program. If not, see <https://www.gnu.org/licenses/>.
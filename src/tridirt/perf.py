@@ -0,0 +1,112 @@
+"""tridirt.perf - Benchmarks the backends of the engine (trid --self-test-perf)."""
+# Copyright (C) 2025 exurd
+# Licensed under GNU AGPLv3. See bottom of code for license information.
+
+# The benchmark makes the same files every time: random bytes with the
+# patterns and strings of a random definition written over them, and some
+# that are random bytes only. Each backend identifies all of them the way
+# trid --jobs does, without the result cache, and has to give the same
+# results as the first one.
+
+import os
+import sys
+import time
+import random
+import tempfile
+
+from tridirt import batch
+from tridirt import engine
+from tridirt import backends
+
+# how many files to identify
+BENCHMARK_FILES = 2000
+# how many random bytes each file has after the part the patterns look at
+BENCHMARK_TAIL = 4096
+# one in this many files matches no definition on purpose
+UNKNOWN_EVERY = 8
+
+
+def random_bytes(rng: random.Random, size: int) -> bytes:
+    """Gets size random bytes."""
+    return rng.getrandbits(size * 8).to_bytes(size, "little") if size else b""
+
+
+def make_files(definitions: engine.Definitions, directory: str, count=BENCHMARK_FILES) -> list:
+    """Makes the files of the benchmark in the directory. Returns their paths."""
+    rng = random.Random(0)
+    paths = []
+    for number in range(count):
+        data = bytearray(random_bytes(rng, definitions.header_size + BENCHMARK_TAIL))
+        if len(definitions) and number % UNKNOWN_EVERY:
+            definition = definitions[rng.randrange(len(definitions))]
+            for position, pattern in definition.patterns:
+                data[position:position + len(pattern)] = pattern
+            for string in definition.strings:
+                position = rng.randrange(definitions.header_size, len(data))
+                data[position:position] = string
+        path = os.path.join(directory, f"{number:05}")
+        with open(path, "wb") as f:
+            f.write(data)
+        paths.append(path)
+    return paths
+
+
+def time_loading(defs_path: str) -> tuple:
+    """Gets how long loading the definitions takes, from the index and by parsing them."""
+    start = time.perf_counter()
+    engine.load_definitions(defs_path)
+    loaded = time.perf_counter() - start
+    start = time.perf_counter()
+    engine.parse_definitions(defs_path)
+    return loaded, time.perf_counter() - start
+
+
+def run(defs_path: str, jobs: int, backend_names=None) -> int:
+    """
+    Runs the benchmark and prints how fast each backend is.
+    Returns the exit code: 1 if the backends gave different results.
+
+    defs_path: The path of the definitions file.
+    jobs: How many worker processes to use.
+    backend_names: The backends to benchmark, or None for all that are installed.
+    """
+    backend_names = backend_names or backends.available_backends()
+    definitions = engine.load_definitions(defs_path)
+    has_index = engine.load_index(defs_path) is not None
+    loaded, parsed = time_loading(defs_path)
+    print(f"Definitions found:  {len(definitions)}")
+    print(f"Loading definitions: {loaded * 1000:.1f} ms ({'index' if has_index else 'no index'}), "
+          f"parsing them: {parsed * 1000:.1f} ms")
+    print(f"Installed backends: {', '.join(backends.available_backends())}")
+
+    exit_code = 0
+    expected = None
+    with tempfile.TemporaryDirectory(prefix="tridirt-perf-") as directory:
+        files = make_files(definitions, directory)
+        print(f"Identifying {len(files)} files with {jobs} worker{'s' if jobs != 1 else ''}:")
+        for backend in backend_names:
+            workers = {}
+            start = time.perf_counter()
+            outputs = list(batch.identify_files(files, defs_path, jobs, backend=backend, workers=workers))
+            elapsed = time.perf_counter() - start
+            used = ", ".join(f"{pid}: {used}" for pid, used in sorted(workers.items()))
+            print(f"  {backend:12} {len(files) / elapsed:8.0f} files/s  (workers {used})")
+            if expected is None:
+                expected = outputs
+            elif outputs != expected:
+                print(f"  {backend} gave different results than {backend_names[0]}!", file=sys.stderr)
+                exit_code = 1
+    return exit_code
+
+
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with this program. If not, see <https://www.gnu.org/licenses/>.
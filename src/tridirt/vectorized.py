@@ -0,0 +1,134 @@
+"""tridirt.vectorized - Scores the patterns of many files at once, with NumPy."""
+# Copyright (C) 2025 exurd
+# Licensed under GNU AGPLv3. See bottom of code for license information.
+
+# Needs NumPy, which isn't installed with tridirt; see the "numpy" extra.
+#
+# Every byte of every pattern is a check that the file has a value at a
+# position. The checks are kept in arrays ordered by definition, and the
+# starts of the files (up to Definitions.header_size) are stacked into a
+# files x header_size array, so a batch of files is checked against every
+# pattern byte with one gather and one compare, and np.logical_and.reduceat
+# gives which definitions matched all their bytes. A definition also needs
+# the file to be at least as long as its furthest pattern.
+#
+# The patterns of a definition that matches give the same points whatever
+# the file, so the scores of the patterns are that matrix times the points
+# of each definition. The strings of the definitions that matched are then
+# searched file by file (see engine.rank), as they need the whole file.
+
+import numpy as np
+
+from tridirt import engine
+
+# how many files to check at once, keeping the files x pattern bytes
+# arrays to a few MB
+BATCH_SIZE = 64
+
+
+class Patterns:
+    """The pattern bytes of the definitions, as arrays of checks."""
+
+    __slots__ = ("positions", "values", "starts", "indexes", "ends", "points", "scored")
+
+    def __init__(self, definitions: engine.Definitions):
+        pattern_index = np.frombuffer(definitions.pattern_index, dtype=np.uint32).astype(np.intp)
+        pattern_positions = np.frombuffer(definitions.pattern_positions, dtype=np.uint16).astype(np.intp)
+        lengths = np.fromiter(map(len, definitions.patterns), dtype=np.intp, count=len(definitions.patterns))
+        # the definition of each pattern, and of each pattern byte
+        pattern_definitions = np.repeat(np.arange(len(definitions)), np.diff(pattern_index))
+        byte_definitions = np.repeat(pattern_definitions, lengths)
+        # where each byte is in its pattern
+        pattern_starts = np.cumsum(lengths) - lengths
+        offsets = np.arange(int(lengths.sum())) - np.repeat(pattern_starts, lengths)
+
+        self.positions = np.repeat(pattern_positions, lengths) + offsets
+        self.values = np.frombuffer(b"".join(definitions.patterns), dtype=np.uint8)
+        # the definitions with pattern bytes, and where their checks start
+        self.indexes, self.starts = np.unique(byte_definitions, return_index=True)
+        # how long a file must be for each definition
+        ends = np.zeros(len(definitions), dtype=np.intp)
+        # (an empty pattern matches even past the end)
+        np.maximum.at(ends, pattern_definitions, np.where(lengths > 0, pattern_positions + lengths, 0))
+        self.ends = ends
+        self.points = np.bincount(pattern_definitions, weights=lengths * np.where(pattern_positions == 0, 1000, 1),
+                                  minlength=len(definitions)).astype(np.int64)
+        # definitions that score if they match: with points or strings
+        self.scored = (self.points > 0) | (np.diff(np.frombuffer(definitions.string_index, dtype=np.uint32)) > 0)
+
+
+# the Patterns of the definitions last used
+_patterns = (None, None)
+
+
+def get_patterns(definitions: engine.Definitions) -> Patterns:
+    """Gets the Patterns of the definitions, making them the first time."""
+    global _patterns
+    if _patterns[0] is not definitions:
+        _patterns = (definitions, Patterns(definitions))
+    return _patterns[1]
+
+
+def pattern_scores(definitions: engine.Definitions, headers: list) -> tuple:
+    """
+    Checks the patterns of the definitions against the files.
+    Returns a files x definitions array of which definitions matched all
+    their patterns, and one of the points those patterns give.
+
+    headers: The starts of the files (see engine.score).
+    """
+    patterns = get_patterns(definitions)
+    size = definitions.header_size
+    stacked = np.zeros((len(headers), size), dtype=np.uint8)
+    lengths = np.zeros(len(headers), dtype=np.intp)
+    for row, header in enumerate(headers):
+        header = np.frombuffer(header, dtype=np.uint8)[:size]
+        stacked[row, :len(header)] = header
+        lengths[row] = len(header)
+
+    matched = lengths[:, None] >= patterns.ends[None, :]
+    if len(patterns.indexes):
+        checks = stacked[:, patterns.positions] == patterns.values
+        matched[:, patterns.indexes] &= np.logical_and.reduceat(checks, patterns.starts, axis=1)
+    return matched, matched * patterns.points
+
+
+def score_files(definitions: engine.Definitions, headers: list, searches: list, num=None) -> list:
+    """
+    Scores the definitions against the files, like engine.score does for each.
+    Returns the results of every file, the most likely first.
+
+    definitions: The definitions from engine.load_definitions.
+    headers: The starts of the files.
+    searches: For each file, a function that gets which of a set of strings
+        are in the upper-cased file.
+    num: How many results to keep for each file, or None for all of them.
+    """
+    patterns = get_patterns(definitions)
+    strings = definitions.strings
+    string_index = definitions.string_index
+    all_results = []
+    for batch in range(0, len(headers), BATCH_SIZE):
+        matched, points = pattern_scores(definitions, headers[batch:batch + BATCH_SIZE])
+        matched &= patterns.scored
+        for row, search in enumerate(searches[batch:batch + BATCH_SIZE]):
+            indexes = np.flatnonzero(matched[row]).tolist()
+            needed = set()
+            for index in indexes:
+                needed.update(strings[string_index[index]:string_index[index + 1]])
+            results = engine.rank(definitions, list(zip(indexes, points[row, indexes].tolist())), needed, search)
+            all_results.append(results if num is None else results[:num])
+    return all_results
+
+
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with this program. If not, see <https://www.gnu.org/licenses/>.
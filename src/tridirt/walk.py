@@ -0,0 +1,174 @@
+"""tridirt.walk - Finds the files in directory trees, listing directories in parallel."""
+# Copyright (C) 2025 exurd
+# Licensed under GNU AGPLv3. See bottom of code for license information.
+
+# Directories are listed with os.scandir by a pool of threads, which keeps
+# several listings in flight on network filesystems. The files found go
+# through a bounded queue to whoever is iterating walk(), so the threads
+# wait when the files come in faster than they are identified, and the
+# whole tree is never held in memory.
+#
+# Globs are matched against the name of a file or directory, or against
+# its whole path if the glob has a "/" in it. Excluded directories are not
+# listed at all.
+#
+# Only regular files are passed on (symbolic links to them included): FIFOs
+# would block the worker opening them, and sockets and devices aren't files
+# to identify. Symbolic links to directories are not followed, like find
+# without -L, so a link back up the tree can't make the walk go round.
+
+import os
+import sys
+import queue
+import fnmatch
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# how many directories to list at once
+WALK_THREADS = 8
+# how many files found may wait to be identified
+QUEUE_SIZE = 1024
+
+# put in the queue when every directory has been listed
+_DONE = object()
+
+
+def matches(path: str, name: str, globs: list) -> bool:
+    """Checks if the file or directory matches any of the globs."""
+    for glob in globs:
+        if fnmatch.fnmatch(path if "/" in glob else name, glob):
+            return True
+    return False
+
+
+class Walker:
+    """
+    Lists directory trees with a thread pool, putting the files found in a queue.
+
+    include: Globs of the files to keep (all of them if empty).
+    exclude: Globs of the files and directories to skip.
+    threads: How many directories to list at once.
+    queue_size: How many files found may wait in the queue.
+    """
+
+    def __init__(self, include=(), exclude=(), threads=WALK_THREADS, queue_size=QUEUE_SIZE):
+        self.include = list(include)
+        self.exclude = list(exclude)
+        self.queue = queue.Queue(queue_size)
+        self._executor = ThreadPoolExecutor(threads)
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        # directories submitted but not listed yet, plus one until start() is done
+        self._pending = 1
+
+    def put(self, item) -> bool:
+        """Puts an item in the queue, waiting for room. Returns False if stopped."""
+        while not self._stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def submit(self, directory: str):
+        """Has the directory listed by the thread pool."""
+        with self._lock:
+            self._pending += 1
+        try:
+            self._executor.submit(self.list_directory, directory)
+        except RuntimeError:
+            # stopped while listing the parent directory
+            self.finish()
+
+    def list_directory(self, directory: str):
+        """Lists a directory, putting its files in the queue and submitting its subdirectories."""
+        try:
+            if self._stopped.is_set():
+                return
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if self._stopped.is_set():
+                        return
+                    path = os.path.join(directory, entry.name)
+                    if matches(path, entry.name, self.exclude):
+                        continue
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        is_file = not is_dir and entry.is_file()
+                    except OSError:
+                        continue
+                    if is_dir:
+                        self.submit(path)
+                    elif is_file and (not self.include or matches(path, entry.name, self.include)):
+                        if not self.put(path):
+                            return
+        except OSError as e:
+            print(f"Could not list {directory}: {e.strerror}", file=sys.stderr)
+        finally:
+            self.finish()
+
+    def finish(self):
+        """Counts a directory as listed, ending the queue after the last one."""
+        with self._lock:
+            self._pending -= 1
+            done = self._pending == 0
+        if done:
+            self.put(_DONE)
+
+    def start(self, directories: list):
+        """Starts listing the directories."""
+        for directory in directories:
+            self.submit(directory)
+        self.finish()
+
+    def stop(self):
+        """Stops listing directories, dropping what is left in the queue."""
+        self._stopped.set()
+        # the directories still waiting return as soon as they start
+        self._executor.shutdown(wait=True)
+
+
+def walk(paths: list, include=(), exclude=(), threads=WALK_THREADS, queue_size=QUEUE_SIZE):
+    """
+    Yields the files in the paths: files given as they are, and the files in
+    the directories given and all their subdirectories, in no set order.
+
+    paths: The files and directories.
+    include: Globs of the files to keep from directories (all of them if empty).
+    exclude: Globs of the files and directories to skip in directories.
+    threads: How many directories to list at once.
+    queue_size: How many files found may wait to be identified.
+    """
+    directories = []
+    for path in paths:
+        if os.path.isdir(path):
+            directories.append(path)
+        else:
+            yield path
+    if not directories:
+        return
+
+    walker = Walker(include, exclude, threads, queue_size)
+    try:
+        walker.start(directories)
+        while True:
+            path = walker.queue.get()
+            if path is _DONE:
+                break
+            yield path
+    finally:
+        walker.stop()
+
+
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along
+# with this program. If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,86 @@
+"""A local HTTP server standing in for the TrID download site in the tests."""
+
+import zlib
+import threading
+import http.server
+
+
+def etag(body: bytes) -> str:
+    """Gets the ETag the server sends for a body."""
+    return f'"{zlib.crc32(body):08x}"'
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+        body = server.files.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        tag = etag(body)
+        if self.headers.get("If-None-Match") == tag:
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        start = 0
+        range_header = self.headers.get("Range")
+        if range_header and self.headers.get("If-Range", tag) == tag:
+            start = int(range_header.split("=", 1)[1].split("-", 1)[0])
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(body)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body) - start))
+        self.send_header("ETag", tag)
+        self.send_header("Last-Modified", "Mon, 01 Sep 2025 00:00:00 GMT")
+        self.end_headers()
+        end = len(body) if server.drop_after is None else min(len(body), start + server.drop_after)
+        self.wfile.write(body[start:end])
+        if end < len(body):
+            # the connection breaks halfway
+            self.close_connection = True
+
+
+class Server(http.server.ThreadingHTTPServer):
+    """
+    Serves files from memory, with ETags and Range requests.
+
+    files: The bodies by path.
+    drop_after: Break every response off after this many bytes, or None.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, files: dict, drop_after=None):
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.files = files
+        self.drop_after = drop_after
+        self.requests = []
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}{path}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,134 @@
+"""Makes TrID definitions packages and files to identify for the tests."""
+
+import os
+import struct
+import random
+
+from tridirt import engine
+
+
+class Def:
+    """A definition to write into a package."""
+
+    def __init__(self, filetype, ext, patterns=(), strings=(), mime=""):
+        self.filetype = filetype
+        self.ext = ext
+        self.patterns = list(patterns)
+        self.strings = list(strings)
+        self.mime = mime
+
+
+def chunk(chunk_id: bytes, data: bytes) -> bytes:
+    """Makes a RIFF chunk, padded to an even size."""
+    return chunk_id + struct.pack("<I", len(data)) + data + b"\0" * (len(data) & 1)
+
+
+def text(s: str) -> bytes:
+    """Makes the data of a text chunk: the text and a NUL."""
+    return s.encode("utf-8") + b"\0"
+
+
+def definition_chunk(definition: Def) -> bytes:
+    """Makes the "DEF " chunk of a definition."""
+    patterns = struct.pack("<H", len(definition.patterns)) + b"".join(
+        struct.pack("<HH", position, len(pattern)) + pattern for position, pattern in definition.patterns)
+    strings = struct.pack("<H", len(definition.strings)) + b"".join(
+        struct.pack("<H", len(string)) + string for string in definition.strings)
+    data = chunk(b"DATA", chunk(b"PATT", patterns) + chunk(b"STRN", strings))
+    info = chunk(b"INFO", chunk(b"TYPE", text(definition.filetype)) + chunk(b"EXT ", text(definition.ext))
+                 + chunk(b"MIME", text(definition.mime)))
+    return chunk(b"DEF ", data + info)
+
+
+def write_package(path: str, definitions: list):
+    """Writes a definitions package (laid out like triddefs.trd) with the definitions."""
+    body = chunk(b"TRDF", b"".join(map(definition_chunk, definitions)))
+    with open(path, "wb") as f:
+        f.write(b"RIFF" + struct.pack("<I", len(body) + 4) + b"TRID" + body)
+
+
+# definitions covering what scoring depends on: patterns at the start and
+# further on, strings, ties, definitions sharing first bytes, odd-sized text
+# chunks, and definitions with no patterns or no strings
+DEFINITIONS = [
+    Def("Alpha archive", "ALP", [(0, b"ALPH")], mime="application/x-alpha"),
+    Def("Alpha archive, version 2", "ALP/AL2", [(0, b"ALPH"), (8, b"\x02\x00")]),
+    Def("Alpha document", "ALD", [(0, b"ALPH")], [b"DOCUMENT"]),
+    Def("Beta image", "BET", [(0, b"BE"), (4, b"IMG")]),
+    Def("Beta image (tied)", "BT2", [(0, b"BE"), (4, b"IMG")]),
+    Def("Gamma text", "GAM", strings=[b"GAMMA", b"TEXT"]),
+    Def("Delta, far pattern", "DEL", [(40, b"DELTA")]),
+    Def("Epsilon", "E", [(0, b"\x00\x00\x00\x01"), (6, b"EPS")], [b"X"]),
+]
+
+
+def random_bytes(rng: random.Random, size: int) -> bytes:
+    """Gets size random bytes."""
+    return rng.getrandbits(size * 8).to_bytes(size, "little") if size else b""
+
+
+def random_definitions(count: int, seed=0) -> list:
+    """
+    Makes random definitions, for a package about the size of the real one:
+    each has a pattern at the start, a few further on and some strings.
+    """
+    rng = random.Random(seed)
+    definitions = []
+    for number in range(count):
+        patterns = [(0, random_bytes(rng, rng.randrange(2, 12)))]
+        patterns += [(rng.randrange(1, 600), random_bytes(rng, rng.randrange(1, 8))) for _ in range(rng.randrange(4))]
+        strings = [bytes(rng.randrange(65, 91) for _ in range(rng.randrange(3, 12))) for _ in range(rng.randrange(3))]
+        definitions.append(Def(f"Generated format {number}", f"G{number}", patterns, strings))
+    return definitions
+
+
+def make_corpus(definitions: engine.Definitions, directory: str, count: int, seed=0) -> list:
+    """
+    Makes files to identify in the directory: random bytes with the patterns
+    and strings of random definitions written over them (some in lower case,
+    some of two definitions at once), random bytes only, and a few files that
+    are empty, shorter than the patterns or longer than a search window.
+    Returns their names.
+    """
+    rng = random.Random(seed)
+    files = {
+        "empty": b"",
+        "short": random_bytes(rng, max(definitions.header_size // 2, 1)),
+    }
+    for number in range(count):
+        data = bytearray(random_bytes(rng, definitions.header_size + rng.randrange(4096)))
+        kind = number % 4
+        if len(definitions) and kind:
+            for _ in range(2 if kind == 3 else 1):
+                definition = definitions[rng.randrange(len(definitions))]
+                for position, pattern in definition.patterns:
+                    data[position:position + len(pattern)] = pattern
+                for string in definition.strings:
+                    if kind == 2:
+                        string = string.lower()
+                    position = rng.randrange(definitions.header_size, len(data) + 1)
+                    data[position:position] = string
+        files[f"{number:04}"] = bytes(data)
+
+    # a string split over two search windows
+    for index in range(len(definitions)):
+        definition = definitions[index]
+        if definition.strings and max(map(len, definition.strings)) > 1:
+            data = bytearray(engine.SEARCH_WINDOW * 2)
+            for position, pattern in definition.patterns:
+                data[position:position + len(pattern)] = pattern
+            string = max(definition.strings, key=len)
+            position = engine.SEARCH_WINDOW - len(string) // 2
+            data[position:position + len(string)] = string
+            position = len(data)
+            for other in definition.strings:
+                if other is not string:
+                    position -= len(other) + 1
+                    data[position:position + len(other)] = other
+            files["window"] = bytes(data)
+            break
+
+    for name, data in files.items():
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(data)
+    return list(files)
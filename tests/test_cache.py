@@ -0,0 +1,41 @@
+"""Tests the result cache (tridirt.cache)."""
+
+import time
+
+from tridirt import cache
+
+
+def last_used(results, digest):
+    return results._db.execute("SELECT last_used FROM results WHERE digest = ?", (digest,)).fetchone()[0]
+
+
+def test_hits_only_update_stale_last_used(tmp_path):
+    results = cache.ResultCache(str(tmp_path / "results.sqlite"))
+    try:
+        digest = cache.content_digest(b"data")
+        results.put(digest, "v1", ["line 1", "line 2"])
+        put_at = last_used(results, digest)
+        assert results.get(digest, "v1") == ["line 1", "line 2"]
+        assert results.get(digest, "v2") is None
+        assert last_used(results, digest) == put_at
+
+        stale = put_at - cache.LAST_USED_INTERVAL - 1
+        with results._db:
+            results._db.execute("UPDATE results SET last_used = ?", (stale,))
+        assert results.get(digest, "v1") == ["line 1", "line 2"]
+        assert last_used(results, digest) >= int(time.time()) - 1
+    finally:
+        results.close()
+
+
+def test_evicts_least_recently_used(tmp_path):
+    results = cache.ResultCache(str(tmp_path / "results.sqlite"), max_entries=2)
+    try:
+        for number in range(3):
+            with results._db:
+                results._db.execute("INSERT INTO results VALUES (?, 'v', '', ?)", (bytes([number]), number))
+        results.evict()
+        assert results.get(b"\0", "v") is None
+        assert results.get(b"\1", "v") == []
+    finally:
+        results.close()
@@ -0,0 +1,73 @@
+"""Tests tridd (tridirt.daemon) over a real Unix socket."""
+
+import os
+import threading
+
+import pytest
+
+from tridirt import cache
+from tridirt import daemon
+from tridirt import engine
+
+import synthetic
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="tridd needs Unix sockets and fork()")
+
+
+@pytest.fixture
+def files(tmp_path):
+    defs_path = str(tmp_path / "triddefs.trd")
+    synthetic.write_package(defs_path, synthetic.DEFINITIONS)
+    directory = tmp_path / "files"
+    directory.mkdir()
+    names = synthetic.make_corpus(engine.parse_definitions(defs_path), str(directory), 20)
+    return defs_path, str(directory), names
+
+
+def expected_output(defs_path, directory, names):
+    definitions = engine.parse_definitions(defs_path)
+    return engine.format_header(definitions) + "".join(
+        "\n" + engine.format_results(name, engine.identify(os.path.join(directory, name), definitions)) + "\n"
+        for name in names)
+
+
+@pytest.mark.parametrize("fork", [False, True])
+def test_serves_and_keeps_connections(files, tmp_path, capsys, fork):
+    defs_path, directory, names = files
+    socket_path = str(tmp_path / "tridd.sock")
+    cache_path = str(tmp_path / "results.sqlite")
+    definitions = daemon.DefinitionsCache(lambda: defs_path)
+    if fork:
+        script_path = tmp_path / "trid.py"
+        script_path.write_text("print('trid.py')\n")
+        scripts = daemon.ScriptCache(lambda: str(script_path))
+        server = daemon.ForkingServer(socket_path, definitions, scripts, cache_path)
+    else:
+        server = daemon.Server(socket_path, definitions, cache_path)
+    server.results.evict()
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    try:
+        expected = expected_output(defs_path, directory, names)
+        capsys.readouterr()
+        for _ in range(3):
+            assert daemon.run_client(socket_path, names, directory) == 0
+            assert capsys.readouterr().out == expected
+        if fork:
+            # options the engine doesn't know go to the preloaded trid.py
+            assert daemon.run_client(socket_path, ["-v"] + names, directory) == 0
+            assert capsys.readouterr().out == "trid.py\n"
+        else:
+            # the handlers took turns with one connection
+            assert len(server.results._idle) == 1
+    finally:
+        server.shutdown()
+        server.server_close()
+        server.results.close()
+
+    results = cache.ResultCache(cache_path)
+    try:
+        count, = results._db.execute("SELECT COUNT(*) FROM results").fetchone()
+        assert count > 0
+    finally:
+        results.close()
@@ -0,0 +1,137 @@
+"""Tests downloading and updating the programs against a local server (tridirt.__main__)."""
+
+import os
+import time
+import threading
+
+import pytest
+
+from tridirt import __main__ as launcher
+
+import server
+
+BODY = os.urandom(512 * 1024)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(time, "sleep", lambda seconds: None)
+
+
+def test_resumes_past_the_retry_limit(tmp_path):
+    # every response breaks off, but each gets further than the last
+    with server.Server({"/trid.zip": BODY}, drop_after=100 * 1024) as s:
+        fields = launcher.download_program(s.url("/trid.zip"), str(tmp_path / "trid.zip"))
+        assert len(s.requests) > launcher.DOWNLOAD_RETRIES + 1
+    assert (tmp_path / "trid.zip").read_bytes() == BODY
+    assert fields["etag"]
+    assert not (tmp_path / "trid.zip.part").exists()
+
+
+def test_gives_up_without_progress(tmp_path):
+    with server.Server({"/trid.zip": BODY}, drop_after=0) as s:
+        with pytest.raises(RuntimeError):
+            launcher.download_program(s.url("/trid.zip"), str(tmp_path / "trid.zip"))
+        assert len(s.requests) == launcher.DOWNLOAD_RETRIES + 1
+
+
+@pytest.mark.parametrize("force", [False, True])
+def test_failed_update(tmp_path, monkeypatch, capsys, force):
+    monkeypatch.setattr(launcher, "INSTALL_DIR", str(tmp_path))
+    monkeypatch.setattr(launcher, "query", lambda question: True)
+    with server.Server({"/trid.zip": BODY}, drop_after=0) as s:
+        tool = dict(launcher.TRID_DICT, url=s.url("/trid.zip"))
+        monkeypatch.setattr(launcher, "get_update_checks", lambda *args: [(tool, 7, force)])
+        monkeypatch.setattr(launcher, "check_for_updates", lambda checks: {
+            "TrID": launcher.get_session().get(tool["url"], stream=True, timeout=10)})
+        if force:
+            # nothing installed to start instead
+            with pytest.raises(RuntimeError):
+                launcher.update_tools(tool, True)
+        else:
+            launcher.update_tools(tool)
+            assert "Could not update TrID" in capsys.readouterr().err
+
+
+def leave_part(tmp_path, data: bytes, validator: str) -> str:
+    """Leaves a .part file and its validator, as a download that was broken off does."""
+    filepath = str(tmp_path / "trid.zip")
+    with open(filepath + ".part", "wb") as f:
+        f.write(data)
+    with open(filepath + ".part.validator", "w") as f:
+        f.write(validator)
+    return filepath
+
+
+def test_whole_part_file_is_finished(tmp_path):
+    filepath = leave_part(tmp_path, BODY, server.etag(BODY))
+    with server.Server({"/trid.zip": BODY}) as s:
+        # the Range request is answered with 416
+        fields = launcher.download_program(s.url("/trid.zip"), filepath)
+        assert len(s.requests) == 1
+    assert (tmp_path / "trid.zip").read_bytes() == BODY
+    assert fields["etag"] == server.etag(BODY)
+    assert not os.path.exists(filepath + ".part")
+    assert not os.path.exists(filepath + ".part.validator")
+
+
+def test_whole_part_file_with_full_response(tmp_path):
+    filepath = leave_part(tmp_path, BODY, server.etag(BODY))
+    with server.Server({"/trid.zip": BODY}) as s:
+        response = launcher.get_session().get(s.url("/trid.zip"), stream=True, timeout=10)
+        fields = launcher.download_program(s.url("/trid.zip"), filepath, response)
+        assert len(s.requests) == 1
+    assert (tmp_path / "trid.zip").read_bytes() == BODY
+    assert fields["etag"] == server.etag(BODY)
+
+
+def test_part_file_the_server_refuses_starts_over(tmp_path):
+    # longer than the file, with the right validator
+    filepath = leave_part(tmp_path, BODY + b"more", server.etag(BODY))
+    with server.Server({"/trid.zip": BODY}) as s:
+        launcher.download_program(s.url("/trid.zip"), filepath)
+        assert len(s.requests) == 2
+    assert (tmp_path / "trid.zip").read_bytes() == BODY
+    assert not os.path.exists(filepath + ".part")
+
+
+def test_client_errors_are_not_retried(tmp_path):
+    with server.Server({}) as s:
+        with pytest.raises(RuntimeError, match="404"):
+            launcher.download_program(s.url("/trid.zip"), str(tmp_path / "trid.zip"))
+        assert len(s.requests) == 1
+
+
+class FakeResponse:
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def close(self):
+        self.closed.set()
+
+
+def test_update_check_past_deadline(monkeypatch, capsys):
+    monkeypatch.setattr(launcher, "CHECK_DEADLINE", 0.2)
+    monkeypatch.setattr(launcher, "is_check_due", lambda tool, time_delta: True)
+    release = threading.Event()
+    responses = {"slow": FakeResponse(), "forced": FakeResponse()}
+
+    def check_for_update(tool, time_delta, force):
+        if tool["name"] == "slow":
+            release.wait()
+        return responses[tool["name"]]
+
+    monkeypatch.setattr(launcher, "check_for_update", check_for_update)
+    threads = set(threading.enumerate())
+    start = time.monotonic()
+    assert launcher.check_for_updates([({"name": "slow"}, 7, False), ({"name": "forced"}, 7, True)]) == {
+        "forced": responses["forced"]}
+    assert time.monotonic() - start < 5
+    assert "Could not check for slow updates: timed out" in capsys.readouterr().out
+    # the stuck check doesn't keep the interpreter from exiting
+    assert all(thread.daemon for thread in set(threading.enumerate()) - threads)
+
+    # and closes the response it gets in the end
+    release.set()
+    assert responses["slow"].closed.wait(5)
+    assert not responses["forced"].closed.is_set()
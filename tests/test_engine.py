@@ -0,0 +1,240 @@
+"""Tests tridirt.engine against definitions whose scores are worked out by hand."""
+
+import os
+import random
+import functools
+
+import pytest
+
+from tridirt import batch
+from tridirt import cache
+from tridirt import engine
+from tridirt import matcher
+
+import synthetic
+
+
+@pytest.fixture(scope="module")
+def defs_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("defs") / "triddefs.trd")
+    synthetic.write_package(path, synthetic.DEFINITIONS)
+    return path
+
+
+@pytest.fixture(scope="module")
+def definitions(defs_path):
+    return engine.parse_definitions(defs_path)
+
+
+def identify_lines(data: bytes, definitions) -> list:
+    return engine.result_lines(engine.identify(data, definitions))
+
+
+def test_parses_package(definitions):
+    assert len(definitions) == len(synthetic.DEFINITIONS)
+    for definition, expected in zip(definitions, synthetic.DEFINITIONS):
+        assert definition.filetype == expected.filetype
+        assert definition.ext == expected.ext
+        assert definition.mime == expected.mime
+        assert definition.patterns == expected.patterns
+        assert definition.strings == [string.upper() for string in expected.strings]
+    # "Delta, far pattern" ends at 45
+    assert definitions.header_size == 45
+
+
+def test_pattern_and_string_weights(definitions):
+    data = b"ALPH\0\0\0\0\x02\x00" + b"\0" * 40 + b"a document"
+    # patterns at 0 score 1000 a byte, elsewhere 1, strings 500 a byte
+    assert identify_lines(data, definitions) == [
+        " 50.0% (.ALD) Alpha document (8000/1/1)",
+        " 25.0% (.ALP/AL2) Alpha archive, version 2 (4002/2/0)",
+        " 25.0% (.ALP) Alpha archive (4000/1/0)",
+    ]
+
+
+def test_ties_keep_definition_order(definitions):
+    assert identify_lines(b"BE\0\0IMG" + b"\0" * 40, definitions) == [
+        " 50.0% (.BET) Beta image (2003/2/0)",
+        " 50.0% (.BT2) Beta image (tied) (2003/2/0)",
+    ]
+
+
+def test_strings_only_and_far_patterns(definitions):
+    data = b"\xff" * 40 + b"DELTA" + b"... some gamma text ..."
+    assert identify_lines(data, definitions) == [
+        " 99.9% (.GAM) Gamma text (4500/0/2)",
+        "  0.1% (.DEL) Delta, far pattern (5/1/0)",
+    ]
+
+
+def test_missing_string_or_short_file(definitions):
+    # Epsilon needs the string "X"; Delta needs 45 bytes
+    assert identify_lines(b"\0\0\0\1\0\0EPS" + b"\0" * 30 + b"DEL", definitions) == []
+    assert identify_lines(b"\0\0\0\1\0\0EPSx", definitions) == ["100.0% (.E) Epsilon (4503/2/1)"]
+
+
+def test_output_format(definitions):
+    results = engine.identify(b"ALPH", definitions)
+    assert engine.format_header(definitions) == "Definitions found:  8\nAnalyzing...\n"
+    assert engine.format_results("a.alp", results) == (
+        "Collecting data from file: a.alp\n"
+        "100.0% (.ALP) Alpha archive (4000/1/0)"
+    )
+    assert engine.format_results("none", []) == "Collecting data from file: none\n Unknown!"
+
+
+def test_index_gives_same_results(defs_path, definitions, tmp_path):
+    names = synthetic.make_corpus(definitions, str(tmp_path), 200)
+    engine.save_index(definitions, defs_path)
+    try:
+        indexed = engine.load_index(defs_path)
+        assert indexed is not None
+        for name in names:
+            path = tmp_path / name
+            assert (engine.result_lines(engine.identify(str(path), indexed))
+                    == engine.result_lines(engine.identify(path.read_bytes(), definitions)))
+    finally:
+        os.remove(defs_path + engine.INDEX_SUFFIX)
+
+
+def test_string_across_search_windows(definitions, tmp_path):
+    names = synthetic.make_corpus(definitions, str(tmp_path), 0)
+    path = tmp_path / "window"
+    assert "window" in names
+    results = engine.identify(str(path), definitions)
+    assert (engine.result_lines(results)
+            == engine.result_lines(engine.identify(path.read_bytes(), definitions)))
+    assert any(result.definition.strings for result in results)
+
+
+def test_batch_matches_engine(defs_path, definitions, tmp_path):
+    names = synthetic.make_corpus(definitions, str(tmp_path), 100)
+    paths = [str(tmp_path / name) for name in names]
+    version = cache.file_digest(defs_path)
+    expected = [engine.result_lines(engine.identify(path, definitions)) for path in paths]
+    assert cache.identify_files(paths, definitions, version) == expected
+    assert list(batch.identify_files(paths, defs_path, 2)) == [
+        (engine.format_lines(path, lines), None) for path, lines in zip(paths, expected)]
+
+
+# definitions whose patterns at position 0 are shorter than, as long as and
+# longer than DISPATCH_BYTES, or that have none, interleaved so that the
+# buckets a file picks have to be merged back into definition order
+BUCKETED = [
+    synthetic.Def("A", "A", [(0, b"A")]),
+    synthetic.Def("No pattern at 0", "N0", [(3, b"D")]),
+    synthetic.Def("ABCDEF", "ABF", [(0, b"ABCDEF")]),
+    synthetic.Def("AB", "AB", [(0, b"AB"), (5, b"F")]),
+    synthetic.Def("Strings only", "S", strings=[b"S"]),
+    synthetic.Def("ABCD", "ABD", [(0, b"ABCD")]),
+    synthetic.Def("A again", "A2", [(0, b"A")]),
+    synthetic.Def("ABC, pattern at 0 second", "ABC", [(4, b"E"), (0, b"ABC")]),
+]
+
+
+def test_buckets_keep_definition_order(tmp_path):
+    defs_path = str(tmp_path / "triddefs.trd")
+    synthetic.write_package(defs_path, BUCKETED)
+    definitions = engine.parse_definitions(defs_path)
+    assert engine.DISPATCH_BYTES == 4
+    assert definitions.make_buckets() == {
+        b"A": [0, 6], b"": [1, 4], b"ABCD": [2, 5], b"AB": [3], b"ABC": [7]}
+    assert definitions.candidates(b"ABCDEF") == [0, 1, 2, 3, 4, 5, 6, 7]
+    # headers shorter than DISPATCH_BYTES
+    assert definitions.candidates(b"ABC") == [0, 1, 3, 4, 6, 7]
+    assert definitions.candidates(b"AB") == [0, 1, 3, 4, 6]
+    assert definitions.candidates(b"A") == [0, 1, 4, 6]
+    assert definitions.candidates(b"") == [1, 4]
+    assert definitions.candidates(b"ABXD") == [0, 1, 3, 4, 6]
+    assert definitions.candidates(b"Z") == [1, 4]
+
+    # ties come out in definition order, as when every definition is checked
+    data = b"ABCDEF S"
+    bucketed = identify_lines(data, definitions)
+    assert bucketed == [
+        " 34.3% (.ABF) ABCDEF (6000/1/0)",
+        " 22.9% (.ABD) ABCD (4000/1/0)",
+        " 17.1% (.ABC) ABC, pattern at 0 second (3001/2/0)",
+        " 11.4% (.AB) AB (2001/2/0)",
+        "  5.7% (.A) A (1000/1/0)",
+        "  5.7% (.A2) A again (1000/1/0)",
+        "  2.9% (.S) Strings only (500/0/1)",
+        "  0.0% (.N0) No pattern at 0 (1/1/0)",
+    ]
+    definitions.buckets = {b"": list(range(len(definitions)))}
+    assert identify_lines(data, definitions) == bucketed
+
+
+def test_buckets_miss_no_match(tmp_path):
+    # every definition that matches a header is a candidate for it
+    defs_path = str(tmp_path / "triddefs.trd")
+    synthetic.write_package(defs_path, BUCKETED)
+    definitions = engine.parse_definitions(defs_path)
+    rng = random.Random(0)
+    for _ in range(2000):
+        header = bytes(rng.choice(b"ABCDEFS") for _ in range(rng.randrange(8)))
+        candidates = definitions.candidates(header)
+        assert candidates == sorted(candidates)
+        for index, definition in enumerate(definitions):
+            if all(header[position:position + len(pattern)] == pattern
+                   for position, pattern in definition.patterns):
+                assert index in candidates, (header, definition.filetype)
+
+
+# headers shorter than the patterns need, and empty
+SHORT_HEADERS = [b"", b"A", b"ALP", b"ALPH", b"BE", b"BE\0\0IM", b"\0\0\0\1\0\0EP", b"\0\0\0\1\0\0EPS"]
+# definitions with no patterns, one of them with nothing to score at all
+NO_PATTERNS = [
+    synthetic.Def("Nothing", "NUL"),
+    synthetic.Def("Zeta text", "ZET", strings=[b"ZETA"]),
+]
+
+
+def test_vectorized_matches_engine(tmp_path):
+    np = pytest.importorskip("numpy")
+    from tridirt import vectorized
+
+    defs_path = str(tmp_path / "triddefs.trd")
+    synthetic.write_package(defs_path, synthetic.DEFINITIONS + NO_PATTERNS)
+    definitions = engine.parse_definitions(defs_path)
+    directory = tmp_path / "files"
+    directory.mkdir()
+    names = synthetic.make_corpus(definitions, str(directory), 200)
+    files = [(directory / name).read_bytes() for name in names]
+    files += SHORT_HEADERS + [b"zeta" + header for header in SHORT_HEADERS]
+    headers = [data[:definitions.header_size] for data in files]
+    searches = [functools.partial(matcher.find_strings, [data]) for data in files]
+
+    matched, points = vectorized.pattern_scores(definitions, headers)
+    for row, header in enumerate(headers):
+        for index, definition in enumerate(definitions):
+            checks = [header[position:position + len(pattern)] == pattern
+                      for position, pattern in definition.patterns]
+            assert matched[row, index] == all(checks), (header, definition.filetype)
+            expected = sum(len(pattern) * (1000 if position == 0 else 1) for position, pattern in definition.patterns)
+            assert points[row, index] == (expected if all(checks) else 0), (header, definition.filetype)
+    assert points.dtype == np.int64
+
+    expected = [engine.result_lines(engine.score(header, definitions, search))
+                for header, search in zip(headers, searches)]
+    assert list(map(engine.result_lines, vectorized.score_files(definitions, headers, searches))) == expected
+    assert ([engine.result_lines(results)[:2] for results in vectorized.score_files(definitions, headers, searches, 2)]
+            == [lines[:2] for lines in expected])
+
+
+def test_numpy_backend_matches_engine(defs_path, definitions, tmp_path):
+    pytest.importorskip("numpy")
+    from tridirt import vectorized
+
+    names = synthetic.make_corpus(definitions, str(tmp_path), 100)
+    for number, header in enumerate(SHORT_HEADERS):
+        (tmp_path / f"header{number}").write_bytes(header)
+        names.append(f"header{number}")
+    paths = [str(tmp_path / name) for name in names]
+    version = cache.file_digest(defs_path)
+    expected = [engine.result_lines(engine.identify(path, definitions)) for path in paths]
+    assert cache.identify_files(paths, definitions, version, score_files=vectorized.score_files) == expected
+    workers = {}
+    assert list(batch.identify_files(paths, defs_path, 2, backend="numpy", workers=workers)) == [
+        (engine.format_lines(path, lines), None) for path, lines in zip(paths, expected)]
+    assert all(used.startswith("numpy") for used in workers.values())
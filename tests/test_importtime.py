@@ -0,0 +1,51 @@
+"""
+Caps what importing the launcher costs, as every trid call pays for it
+before anything else happens (see python -X importtime).
+"""
+
+import os
+import sys
+import subprocess
+
+import tridirt
+
+# modules the launcher only needs when it downloads or installs something
+HEAVY_MODULES = ["requests", "urllib3", "tqdm", "zipfile", "sqlite3", "tridirt.engine", "tridirt.batch"]
+# how many microseconds importing tridirt.__main__ may take, with everything
+# it imports; it takes about 15000 on a laptop, and importing requests with
+# it well over 50000
+MAX_IMPORT_TIME = 40000
+# the best of this many runs is compared, as single runs are noisy
+RUNS = 5
+
+
+def run_python(*args) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(list(tridirt.__path__)[0]))
+    return subprocess.run([sys.executable] + list(args), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, env=env, check=True)
+
+
+def import_time() -> int:
+    """Gets the cumulative microseconds -X importtime reports for tridirt.__main__."""
+    stderr = run_python("-X", "importtime", "-c", "import tridirt.__main__").stderr
+    for line in stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == "tridirt.__main__":
+            return int(fields[1])
+    raise AssertionError(f"tridirt.__main__ not in -X importtime output:\n{stderr}")
+
+
+def test_no_heavy_imports():
+    # (site may have imported some of them already, e.g. for .pth files)
+    stdout = run_python("-c", "import sys; before = set(sys.modules); import tridirt.__main__; "
+                              "print('\\n'.join(set(sys.modules) - before))").stdout
+    imported = set(stdout.split())
+    assert "tridirt.__main__" in imported
+    assert not imported & set(HEAVY_MODULES)
+
+
+def test_import_time_cap():
+    # once to write the bytecode caches
+    import_time()
+    best = min(import_time() for _ in range(RUNS))
+    assert best < MAX_IMPORT_TIME, f"importing tridirt.__main__ took {best} us"
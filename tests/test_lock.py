@@ -0,0 +1,99 @@
+"""
+Stress test of the install lock: many launchers start at once against a
+local stand-in for the download site, and only one of them may download and
+install each update.
+"""
+
+import io
+import os
+import sys
+import json
+import zipfile
+import subprocess
+
+import pytest
+
+import tridirt
+
+import server
+import synthetic
+
+# how many launchers to start at once
+LAUNCHERS = 12
+
+# a launcher whose downloads come from the stand-in server (its base URL is
+# the first argument) and that says yes to every question
+LAUNCHER = """
+import sys
+from tridirt import __main__ as launcher
+for tool in launcher.TOOLS.values():
+    tool["url"] = sys.argv[1] + "/" + tool["url"].rsplit("/", 1)[-1]
+launcher.query = lambda question, default="yes": True
+sys.argv = ["trid"] + sys.argv[2:]
+sys.exit(launcher.start_program(launcher.TRID_DICT))
+"""
+
+pytestmark = pytest.mark.skipif(os.name == "nt", reason="the launchers share a HOME directory")
+
+
+def make_zip(files: dict) -> bytes:
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w") as z:
+        for name, contents in files.items():
+            z.writestr(name, contents)
+    return data.getvalue()
+
+
+def trid_zip(version: int) -> bytes:
+    return make_zip({"trid.py": f"import sys\nprint('trid.py {version}', *sys.argv[1:])\n"})
+
+
+def run_launchers(home: str, url: str) -> list:
+    """Starts LAUNCHERS launchers at once. Returns their stdout, after checking they all exited with 0."""
+    src = os.path.dirname(list(tridirt.__path__)[0])
+    env = dict(os.environ, HOME=home, PYTHONPATH=src)
+    env.pop("TRIDIRT_BACKGROUND_UPDATES", None)
+    processes = [subprocess.Popen([sys.executable, "-c", LAUNCHER, url, "file"], env=env,
+                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+                 for _ in range(LAUNCHERS)]
+    outputs = []
+    for process in processes:
+        stdout, stderr = process.communicate(timeout=120)
+        assert process.returncode == 0, stderr
+        outputs.append(stdout)
+    return outputs
+
+
+def test_one_launcher_installs(tmp_path):
+    defs_path = str(tmp_path / "triddefs.trd")
+    synthetic.write_package(defs_path, synthetic.DEFINITIONS)
+    with open(defs_path, "rb") as f:
+        defs_zip = make_zip({"triddefs.trd": f.read()})
+    home = tmp_path / "home"
+    home.mkdir()
+
+    with server.Server({"/trid.zip": trid_zip(1), "/triddefs.zip": defs_zip}) as s:
+        # nothing installed: one installs, the others wait for it
+        for stdout in run_launchers(str(home), s.url("")):
+            assert stdout.endswith("trid.py 1 file\n")
+        assert s.requests.count("/trid.zip") == 1
+        assert s.requests.count("/triddefs.zip") == 1
+        assert os.path.isfile(home / ".trid" / "current" / "triddefs.trd.idx")
+
+        # a new version, and every check due: one installs it, the others
+        # start with whichever version is installed when they get to run
+        s.files["/trid.zip"] = trid_zip(2)
+        state_path = home / ".trid" / "state.json"
+        state = json.loads(state_path.read_text())
+        for entry in state["tools"].values():
+            entry["checked"] = "01-01-2000 00:00:00"
+        state_path.write_text(json.dumps(state))
+        del s.requests[:]
+        outputs = run_launchers(str(home), s.url(""))
+        assert all(stdout.endswith(("trid.py 1 file\n", "trid.py 2 file\n")) for stdout in outputs)
+        assert s.requests.count("/trid.zip") == 1
+        assert s.requests.count("/triddefs.zip") == 1
+
+    assert (home / ".trid" / "current" / "trid.py").read_text().startswith("import sys\nprint('trid.py 2'")
+    state = json.loads(state_path.read_text())
+    assert set(state["tools"]) == {"TrID", "TrIDDefs"}
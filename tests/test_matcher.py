@@ -0,0 +1,99 @@
+"""Tests tridirt.matcher against a naive search."""
+
+import random
+
+import pytest
+
+from tridirt import matcher
+
+# how many random cases to check
+CASES = 500
+# the symbols of the random data and strings: few, so strings are often
+# found, in both cases, and a byte not in any string
+ALPHABET = b"ABCabc\0"
+
+
+def naive_find(windows, strings) -> set:
+    data = b"".join(windows).upper()
+    return {string for string in strings if string in data}
+
+
+def random_case(rng: random.Random):
+    """Makes data split into windows of 1 to 50 bytes, and upper case strings to look for."""
+    data = bytes(rng.choice(ALPHABET) for _ in range(rng.randrange(200)))
+    windows = []
+    start = 0
+    while start < len(data):
+        end = start + rng.randrange(1, 51)
+        windows.append(data[start:end])
+        start = end
+    strings = set()
+    for _ in range(rng.randrange(1, 20)):
+        if data and rng.randrange(2):
+            # one that is in the data, maybe across windows
+            start = rng.randrange(len(data))
+            strings.add(data[start:start + rng.randrange(1, 12)].upper())
+        else:
+            strings.add(bytes(rng.choice(ALPHABET.upper()) for _ in range(rng.randrange(1, 8))))
+    return windows, strings
+
+
+@pytest.fixture(params=["contains", "stringzilla", "automaton"])
+def search(request, monkeypatch):
+    """Makes find_strings search each string on its own (with bytes.__contains__ or stringzilla), or use the automaton."""
+    if request.param == "stringzilla":
+        pytest.importorskip("stringzilla")
+    monkeypatch.setattr(matcher, "_contains", None)
+    matcher.use_stringzilla(request.param == "stringzilla")
+    min_strings = 0 if request.param == "automaton" else float("inf")
+    monkeypatch.setattr(matcher, "AUTOMATON_MIN_STRINGS", min_strings)
+    monkeypatch.setattr(matcher, "STRINGZILLA_AUTOMATON_MIN_STRINGS", min_strings)
+    return request.param
+
+
+def test_find_strings_matches_naive_search(search):
+    rng = random.Random(0)
+    for _ in range(CASES):
+        windows, strings = random_case(rng)
+        assert matcher.find_strings(windows, strings) == naive_find(windows, strings), (windows, strings)
+
+
+def test_find_strings_across_windows(search):
+    windows = [b"....GAM", b"M", b"a te", b"xt"]
+    strings = {b"GAMMA", b"TEXT", b"GAMMA TEXT", b"MISSING"}
+    assert matcher.find_strings(windows, strings) == {b"GAMMA", b"TEXT", b"GAMMA TEXT"}
+
+
+def test_find_strings_folds_lower_case(search):
+    assert matcher.find_strings([b"a document"], {b"DOCUMENT", b"document"}) == {b"DOCUMENT"}
+    # only ASCII letters are folded
+    assert matcher.find_strings([b"\xe9"], {b"\xc9", b"\xe9"}) == {b"\xe9"}
+
+
+def test_find_strings_empty(search):
+    assert matcher.find_strings([], {b"", b"X"}) == {b""}
+    assert matcher.find_strings([b"abc"], set()) == set()
+
+
+def test_automaton_search_carries_state():
+    rng = random.Random(1)
+    for _ in range(CASES):
+        windows, strings = random_case(rng)
+        automaton = matcher.Automaton(strings)
+        found = set()
+        state = 0
+        for window in windows:
+            state = automaton.search(window, found, state)
+        assert found == naive_find(windows, strings), (windows, strings)
+        # in one go, the same
+        whole = set()
+        automaton.search(b"".join(windows), whole)
+        assert whole == found
+
+
+def test_automaton_overlapping_strings():
+    # strings that are suffixes or inside others are found through fallbacks
+    automaton = matcher.Automaton({b"ABCD", b"BC", b"CDE", b"D"})
+    found = set()
+    automaton.search(b"xabcdx", found)
+    assert found == {b"ABCD", b"BC", b"D"}
@@ -0,0 +1,31 @@
+"""Tests the launcher's own options (tridirt.__main__.split_launcher_options and run_engine)."""
+
+import pytest
+
+from tridirt import __main__ as launcher
+
+
+def test_split_launcher_options():
+    options, rest = launcher.split_launcher_options(
+        ["--jobs", "4", "-n", "3", "--include=*.bin", "--include", "*.dat", "--no-cache", "a", "b"])
+    assert options == {"jobs": 4, "include": ["*.bin", "*.dat"], "no-cache": True}
+    assert rest == ["-n", "3", "a", "b"]
+
+
+@pytest.mark.parametrize("argv", [["--jobs", "x"], ["--include"]])
+def test_bad_values_exit_2(argv):
+    with pytest.raises(SystemExit) as e:
+        launcher.split_launcher_options(argv)
+    assert e.value.code == 2
+
+
+@pytest.mark.parametrize("options", [
+    {"no-cache": True},
+    {"incremental": True},
+    {"include": ["*.bin"]},
+    {"exclude": ["tmp"], "jobs": 4},
+    {"include": ["*.bin"], "backend": "pure"},
+])
+def test_options_that_would_be_ignored_exit_2(options, capsys):
+    assert launcher.run_engine(["file"], options) == 2
+    assert "only work with" in capsys.readouterr().err
@@ -0,0 +1,92 @@
+"""
+Differential tests of tridirt.engine against trid.py: both identify the same
+generated files, and what they print has to be the same, from "Definitions
+found:" on (the ranked results, their points and percentages, and the format
+the launcher prints them in).
+
+They need trid.py, which isn't shipped with tridirt: they use the one in
+TRIDIRT_TRID_DIR, or else the one the launcher installed, and are skipped if
+there is none.
+"""
+
+import os
+import sys
+import difflib
+import subprocess
+
+import pytest
+
+from tridirt import engine
+
+import synthetic
+
+# how many files to make for each package
+CORPUS_FILES = 300
+# how many results to compare for each file
+RESULTS = 20
+# the trid.py option for using another definitions package
+DEFS_OPTION = "-d"
+
+
+def get_trid_dir() -> str:
+    if "TRIDIRT_TRID_DIR" in os.environ:
+        return os.environ["TRIDIRT_TRID_DIR"]
+    from tridirt.__main__ import get_program_dir
+    return get_program_dir()
+
+
+TRID_DIR = get_trid_dir()
+TRID_PY = os.path.join(TRID_DIR, "trid.py")
+
+pytestmark = pytest.mark.skipif(not os.path.isfile(TRID_PY), reason=f"trid.py is not installed in {TRID_DIR}")
+
+
+def run_trid_py(directory: str, names: list, defs_path=None) -> str:
+    """Runs trid.py on the files. Returns what it prints from "Definitions found:" on."""
+    args = [sys.executable, TRID_PY] + names + ["-n", str(RESULTS)]
+    if defs_path is not None:
+        args += [DEFS_OPTION, defs_path]
+    process = subprocess.run(args, cwd=directory, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             universal_newlines=True)
+    assert process.returncode == 0, process.stderr
+    start = process.stdout.find("Definitions found:")
+    assert start != -1, process.stdout
+    return process.stdout[start:]
+
+
+def run_engine(directory: str, names: list, definitions: engine.Definitions) -> str:
+    """Identifies the files with the engine. Returns what tridd prints for them."""
+    out = [engine.format_header(definitions)]
+    for name in names:
+        results = engine.identify(os.path.join(directory, name), definitions)
+        out.append("\n" + engine.format_results(name, results, RESULTS) + "\n")
+    return "".join(out)
+
+
+def assert_same_output(expected: str, actual: str):
+    expected_lines = [line.rstrip() for line in expected.rstrip().splitlines()]
+    actual_lines = [line.rstrip() for line in actual.rstrip().splitlines()]
+    if expected_lines != actual_lines:
+        diff = difflib.unified_diff(expected_lines, actual_lines, "trid.py", "tridirt.engine", lineterm="")
+        pytest.fail("\n".join(list(diff)[:200]))
+
+
+def test_installed_definitions(tmp_path):
+    defs_path = os.path.join(TRID_DIR, "triddefs.trd")
+    if not os.path.isfile(defs_path):
+        pytest.skip(f"triddefs.trd is not installed in {TRID_DIR}")
+    definitions = engine.load_definitions(defs_path)
+    names = synthetic.make_corpus(definitions, str(tmp_path), CORPUS_FILES)
+    assert_same_output(run_trid_py(str(tmp_path), names), run_engine(str(tmp_path), names, definitions))
+
+
+def test_generated_definitions(tmp_path):
+    # covers the weights and ties of synthetic.DEFINITIONS, in a package
+    # made the way the engine reads them
+    defs_path = str(tmp_path / "synthetic.trd")
+    synthetic.write_package(defs_path, synthetic.DEFINITIONS)
+    definitions = engine.parse_definitions(defs_path)
+    directory = tmp_path / "files"
+    directory.mkdir()
+    names = synthetic.make_corpus(definitions, str(directory), CORPUS_FILES)
+    assert_same_output(run_trid_py(str(directory), names, defs_path), run_engine(str(directory), names, definitions))
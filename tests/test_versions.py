@@ -0,0 +1,66 @@
+"""Tests installing versions of the programs side by side (tridirt.__main__.install_program)."""
+
+import os
+import time
+import socket
+import zipfile
+
+import pytest
+
+from tridirt import __main__ as launcher
+
+
+@pytest.fixture
+def install_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(launcher, "INSTALL_DIR", str(tmp_path))
+    monkeypatch.setattr(launcher, "VERSIONS_DIR", str(tmp_path / "versions"))
+    monkeypatch.setattr(launcher, "CURRENT_DIR", str(tmp_path / "current"))
+    return tmp_path
+
+
+def install(install_dir, text: str) -> dict:
+    path = str(install_dir / "trid.zip")
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("trid.py", text)
+    return launcher.install_program(path)[1]
+
+
+def test_deactivated_versions_are_kept_for_a_while(install_dir):
+    for number in range(3):
+        install(install_dir, f"print({number})")
+    versions = sorted(os.listdir(install_dir / "versions"))
+    # more than KEEP_VERSIONS, but two have only just been replaced
+    assert len(versions) == 3
+    assert (install_dir / "current" / "trid.py").read_text() == "print(2)"
+    for name in versions:
+        assert (install_dir / "versions" / name / "trid.py").exists()
+
+    old = time.time() - launcher.VERSION_GRACE - 60
+    os.utime(install_dir / "versions" / versions[0], (old, old))
+    launcher.remove_old_versions()
+    assert sorted(os.listdir(install_dir / "versions")) == versions[1:]
+
+
+def test_versions_within_the_count_are_kept(install_dir):
+    install(install_dir, "print(0)")
+    install(install_dir, "print(1)")
+    old = time.time() - launcher.VERSION_GRACE - 60
+    for name in os.listdir(install_dir / "versions"):
+        os.utime(install_dir / "versions" / name, (old, old))
+    launcher.remove_old_versions()
+    assert len(os.listdir(install_dir / "versions")) == launcher.KEEP_VERSIONS
+
+
+def test_unversioned_install_is_carried_over_without_state(install_dir, monkeypatch):
+    monkeypatch.setattr(launcher, "STATE_FILE", str(install_dir / "state.json"))
+    monkeypatch.setattr(launcher, "CACHE_FILE", str(install_dir / "results.sqlite"))
+    monkeypatch.setattr(launcher, "SOCKET_FILE", str(install_dir / "tridd.sock"))
+    for name in ("trid.py", "triddefs.trd", "state.json", "results.sqlite", "results.sqlite-wal",
+                 "results.sqlite-shm", "results.sqlite-journal", "trid.zip", ".lock"):
+        (install_dir / name).write_text(name)
+    dest = install_dir / "versions" / "1"
+    dest.mkdir(parents=True)
+    with socket.socket(socket.AF_UNIX) as listener:
+        listener.bind(str(install_dir / "tridd.sock"))
+        launcher.copy_program_dir(str(install_dir), str(dest))
+    assert sorted(os.listdir(dest)) == ["trid.py", "triddefs.trd"]
@@ -0,0 +1,87 @@
+"""Tests finding the files in directory trees (tridirt.walk)."""
+
+import os
+import time
+import threading
+
+import pytest
+
+from tridirt import walk
+
+# how long closing a walk may take
+STOP_TIMEOUT = 10
+
+
+@pytest.fixture
+def tree(tmp_path):
+    for name in ("a.txt", "b.bin", "sub/c.txt", "sub/d.bin", "sub/deeper/e.txt", "other/f.txt"):
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(name)
+    return tmp_path
+
+
+def walked(tree, **kwargs) -> list:
+    return sorted(os.path.relpath(path, tree) for path in walk.walk([str(tree)], **kwargs))
+
+
+def test_walks_whole_tree(tree):
+    assert walked(tree) == ["a.txt", "b.bin", "other/f.txt", "sub/c.txt", "sub/d.bin", "sub/deeper/e.txt"]
+
+
+def test_files_given_are_kept():
+    # files given on the command line are yielded as they are, even if they don't exist
+    assert list(walk.walk(["b.bin", "missing"], include=["*.txt"])) == ["b.bin", "missing"]
+
+
+def test_globs_match_names(tree):
+    assert walked(tree, include=["*.txt"]) == ["a.txt", "other/f.txt", "sub/c.txt", "sub/deeper/e.txt"]
+    assert walked(tree, include=["*.txt", "d.*"]) == [
+        "a.txt", "other/f.txt", "sub/c.txt", "sub/d.bin", "sub/deeper/e.txt"]
+    assert walked(tree, exclude=["*.bin"]) == ["a.txt", "other/f.txt", "sub/c.txt", "sub/deeper/e.txt"]
+    # excluding a directory skips all that is in it
+    assert walked(tree, exclude=["sub"]) == ["a.txt", "b.bin", "other/f.txt"]
+    assert walked(tree, include=["*.txt"], exclude=["deeper", "a.*"]) == ["other/f.txt", "sub/c.txt"]
+
+
+def test_globs_with_slash_match_paths(tree):
+    assert walked(tree, include=["*/sub/*.txt"]) == ["sub/c.txt", "sub/deeper/e.txt"]
+    assert walked(tree, exclude=[f"{tree}/sub/deeper"]) == [
+        "a.txt", "b.bin", "other/f.txt", "sub/c.txt", "sub/d.bin"]
+    # without a "/", only the name is matched
+    assert walked(tree, include=["sub*"]) == []
+
+
+def test_symlinks_to_directories_are_not_followed(tree):
+    (tree / "sub" / "up").symlink_to(tree, target_is_directory=True)
+    (tree / "outside").symlink_to(tree / "other", target_is_directory=True)
+    (tree / "link.txt").symlink_to(tree / "a.txt")
+    # links to files are kept
+    assert walked(tree) == [
+        "a.txt", "b.bin", "link.txt", "other/f.txt", "sub/c.txt", "sub/d.bin", "sub/deeper/e.txt"]
+
+
+@pytest.mark.skipif(not hasattr(os, "mkfifo"), reason="no FIFOs")
+def test_fifos_are_skipped(tree):
+    os.mkfifo(str(tree / "sub" / "fifo.txt"))
+    (tree / "broken.txt").symlink_to(tree / "missing")
+    assert walked(tree, include=["*.txt"]) == ["a.txt", "other/f.txt", "sub/c.txt", "sub/deeper/e.txt"]
+
+
+def test_closing_early_stops_threads(tmp_path):
+    for number in range(20):
+        directory = tmp_path / f"dir{number}"
+        directory.mkdir()
+        for name in range(50):
+            (directory / str(name)).write_bytes(b"")
+    threads = set(threading.enumerate())
+
+    files = walk.walk([str(tmp_path)], threads=4, queue_size=2)
+    next(files)
+    # let the threads fill the queue and wait for room
+    time.sleep(0.2)
+    closer = threading.Thread(target=files.close, daemon=True)
+    closer.start()
+    closer.join(STOP_TIMEOUT)
+    assert not closer.is_alive(), "closing the walk hung"
+    assert [thread for thread in threading.enumerate() if thread not in threads] == []